@@ -0,0 +1,136 @@
+import random
+
+from aalpy.base import Oracle, SUL
+from aalpy.base.SUL import CacheSUL
+from aalpy.learning_algs import run_Lstar
+
+
+class AlphabetRefined(Exception):
+    # raised out of run_Lstar when a counterexample shows that two merged letters differ
+    def __init__(self, context: tuple):
+        super().__init__(context)
+        self.context = context
+
+
+def probe_prefixes(alphabet: list, random_prefixes: int = 0, max_length: int = 4, seed: int | None = None) -> list:
+    # the empty word, every single letter and a few random words as states to compare letters in
+    rng = random.Random(seed)
+    prefixes = [()] + [(letter,) for letter in alphabet]
+    prefixes += [tuple(rng.choices(alphabet, k=rng.randint(2, max_length))) for _ in range(random_prefixes)]
+    return list(dict.fromkeys(prefixes))
+
+
+def letter_signatures(sul: SUL, alphabet: list, contexts: list) -> dict:
+    # per letter, the outputs from the letter on after every (prefix, suffix) context
+    signatures = {}
+    for letter in alphabet:
+        signatures[letter] = tuple(tuple(sul.query(prefix + (letter,) + suffix)[len(prefix):])
+                                   for prefix, suffix in contexts)
+    return signatures
+
+
+def group_letters(signatures: dict) -> list:
+    # letters with the same signature, each group in alphabet order, its first letter stands for it
+    groups = {}
+    for letter, signature in signatures.items():
+        groups.setdefault(signature, []).append(letter)
+    return list(groups.values())
+
+
+def expand_model(model, groups: list):
+    # gives every merged letter the transitions and outputs of its representative
+    for state in model.states:
+        for representative, *letters in groups:
+            for letter in letters:
+                state.transitions[letter] = state.transitions[representative]
+                if hasattr(state, 'output_fun'):
+                    state.output_fun[letter] = state.output_fun[representative]
+    return model
+
+
+class ReducedAlphabetEqOracle(Oracle):
+    # runs eq_oracle over the full alphabet on the expanded hypothesis and maps its
+    # counterexamples back to representatives, raises AlphabetRefined if that changes the outputs
+    def __init__(self, eq_oracle: Oracle, groups: list, sul: SUL):
+        super().__init__([group[0] for group in groups], sul)
+        self.eq_oracle = eq_oracle
+        self.groups = groups
+        self.representatives = {letter: group[0] for group in groups for letter in group}
+
+    def find_cex(self, hypothesis):
+        self.eq_oracle.sul = self.sul
+        # the merged letters are added to the hypothesis itself, L* only ever follows representatives
+        cex = self.eq_oracle.find_cex(expand_model(hypothesis, self.groups))
+        self.num_queries, self.num_steps = self.eq_oracle.num_queries, self.eq_oracle.num_steps
+        if cex is None:
+            return None
+        cex = tuple(cex)
+        reduced = tuple(self.representatives[letter] for letter in cex)
+        # CacheSUL answers from its cache with tuples
+        outputs = tuple(self.sul.query(reduced))
+        if tuple(self.sul.query(cex)) == outputs:
+            return reduced
+
+        # cex with its first i letters replaced, outputs differ for 0 and agree for len(cex)
+        def agrees(i: int) -> bool:
+            return tuple(self.sul.query(reduced[:i] + cex[i:])) == outputs
+
+        low, high = 0, len(cex)
+        while high - low > 1:
+            middle = (low + high) // 2
+            if agrees(middle):
+                high = middle
+            else:
+                low = middle
+        raise AlphabetRefined((reduced[:low], cex[low + 1:]))
+
+
+def run_reduced_Lstar(alphabet: list, sul: SUL, eq_oracle: Oracle, automaton_type: str,
+                      contexts: list | None = None, random_prefixes: int = 0, max_refinements: int = 10,
+                      cache_and_non_det_check: bool = True, return_data: bool = False,
+                      print_level: int = 2, **kwargs):
+    # learns over one letter per group of letters the SUL answers alike, then expands the
+    # model back to the full alphabet; counterexamples that split a group restart learning
+    if cache_and_non_det_check:
+        # one cache for the probes and every restart
+        sul = CacheSUL(sul)
+    if contexts is None:
+        # the output of each letter in a few states and the state it leads to from the initial one,
+        # letters that differ elsewhere are split by the equivalence oracle
+        contexts = [(prefix, ()) for prefix in probe_prefixes(alphabet, random_prefixes)]
+        contexts += [((), (letter,)) for letter in alphabet]
+    signatures = letter_signatures(sul, alphabet, contexts)
+    groups = group_letters(signatures)
+    probe_queries = sul.num_queries
+
+    refinements = 0
+    while True:
+        reduced = [group[0] for group in groups]
+        if print_level > 1:
+            merged = [group for group in groups if len(group) > 1]
+            print(f'Reduced alphabet: {len(reduced)} of {len(alphabet)} letters, merged {merged}.')
+        oracle = ReducedAlphabetEqOracle(eq_oracle, groups, sul)
+        try:
+            model, info = run_Lstar(reduced, sul, oracle, automaton_type, cache_and_non_det_check=False,
+                                    return_data=True, print_level=print_level, **kwargs)
+            break
+        except AlphabetRefined as refined:
+            refinements += 1
+            if refinements > max_refinements:
+                # the reduction does not pay off, learn over the full alphabet
+                groups = [[letter] for letter in alphabet]
+                continue
+            for letter, signature in letter_signatures(sul, alphabet, [refined.context]).items():
+                signatures[letter] += signature
+            groups = group_letters(signatures)
+
+    model = expand_model(model, groups)
+    info['alphabet_size'] = len(alphabet)
+    info['reduced_alphabet_size'] = len(groups)
+    info['alphabet_refinements'] = refinements
+    info['queries_alphabet_probing'] = probe_queries
+    if cache_and_non_det_check:
+        info['cache_saved'] = sul.num_cached_queries
+    if return_data:
+        return model, info
+    return model
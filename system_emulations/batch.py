@@ -0,0 +1,24 @@
+import numpy as np
+
+
+def encode_commands(commands, opcodes: dict) -> np.ndarray:
+    return np.fromiter((opcodes.get(command, -1) for command in commands), dtype=np.int16)
+
+
+class BatchResult:
+    def __init__(self, codes: np.ndarray, messages: tuple, extra: dict | None = None):
+        self.codes = codes
+        self._messages = messages
+        # messages that can not be derived from the result code (e.g. info replies)
+        self.extra = extra if extra is not None else {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def message(self, index: int) -> str:
+        extra = self.extra.get(index)
+        return extra if extra is not None else self._messages[self.codes[index]]
+
+    def messages(self):
+        for index in range(len(self.codes)):
+            yield self.message(index)
@@ -0,0 +1,118 @@
+import argparse
+import csv
+import json
+import random
+import time
+from itertools import product
+
+from aalpy.oracles import RandomWalkEqOracle
+from aalpy.learning_algs import run_Lstar
+
+from system_emulations.test_locators import PATH_TO_RESULTS_DIR
+from system_emulations.test_sul import SYSTEMS
+
+AUTOMATON_TYPES = ['dfa', 'moore', 'mealy']
+CLOSING_STRATEGIES = ['longest_first', 'shortest_first', 'single']
+CEX_PROCESSING = ['rs', 'longest_prefix', 'linear_fwd', 'linear_bwd',
+                  'exponential_fwd', 'exponential_bwd']
+
+FIELDS = ['system', 'automaton_type', 'closing_strategy', 'cex_processing', 'repeat',
+          'wall_time', 'learning_time', 'eq_oracle_time', 'learning_rounds',
+          'queries_learning', 'steps_learning', 'queries_eq_oracle', 'steps_eq_oracle',
+          'cache_saved', 'states']
+
+
+def run_configuration(system: str, automaton_type: str, closing_strat: str, cex_proc: str,
+                      num_steps: int = 1000, reset_prob: float = 0.1,
+                      max_learning_rounds: int | None = 10, seed: int = 0) -> dict:
+    sul_class, alphabet = SYSTEMS[system]
+    random.seed(seed)
+    sul = sul_class()
+    eq_oracle = RandomWalkEqOracle(alphabet=alphabet, sul=sul, num_steps=num_steps,
+                                   reset_prob=reset_prob)
+    start = time.perf_counter()
+    learned_model, info = run_Lstar(alphabet=alphabet, sul=sul, eq_oracle=eq_oracle,
+                                    automaton_type=automaton_type,
+                                    closing_strategy=closing_strat,
+                                    cex_processing=cex_proc,
+                                    max_learning_rounds=max_learning_rounds,
+                                    return_data=True, print_level=0)
+    wall_time = time.perf_counter() - start
+    return {
+        'system': system,
+        'automaton_type': automaton_type,
+        'closing_strategy': closing_strat,
+        'cex_processing': cex_proc,
+        'wall_time': round(wall_time, 4),
+        'learning_time': info['learning_time'],
+        'eq_oracle_time': info['eq_oracle_time'],
+        'learning_rounds': info['learning_rounds'],
+        'queries_learning': info['queries_learning'],
+        'steps_learning': info['steps_learning'],
+        'queries_eq_oracle': info['queries_eq_oracle'],
+        'steps_eq_oracle': info['steps_eq_oracle'],
+        'cache_saved': info.get('cache_saved', 0),
+        'states': len(learned_model.states),
+    }
+
+
+def run_benchmark(systems=tuple(SYSTEMS), automaton_types=AUTOMATON_TYPES,
+                  closing_strategies=CLOSING_STRATEGIES, cex_processing=CEX_PROCESSING,
+                  repeats: int = 1, **kwargs) -> list:
+    results = []
+    for system, automaton_type, closing_strat, cex_proc, repeat in product(
+            systems, automaton_types, closing_strategies, cex_processing, range(repeats)):
+        result = run_configuration(system, automaton_type, closing_strat, cex_proc,
+                                   seed=repeat, **kwargs)
+        result['repeat'] = repeat
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+
+def fastest_configurations(results: list) -> dict:
+    fastest = {}
+    for result in results:
+        best = fastest.get(result['system'])
+        if best is None or result['wall_time'] < best['wall_time']:
+            fastest[result['system']] = result
+    return fastest
+
+
+def save_results(results: list, json_path=None, csv_path=None) -> None:
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"results": results,
+                       "fastest": fastest_configurations(results)}, f, indent=2)
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--systems", nargs="+", choices=list(SYSTEMS), default=list(SYSTEMS))
+    parser.add_argument("--automaton-types", nargs="+", choices=AUTOMATON_TYPES, default=AUTOMATON_TYPES)
+    parser.add_argument("--closing-strategies", nargs="+", choices=CLOSING_STRATEGIES,
+                        default=CLOSING_STRATEGIES)
+    parser.add_argument("--cex-processing", nargs="+", choices=CEX_PROCESSING, default=CEX_PROCESSING)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--num-steps", type=int, default=1000)
+    parser.add_argument("--json", default=str(PATH_TO_RESULTS_DIR.joinpath("benchmark.json")))
+    parser.add_argument("--csv", default=str(PATH_TO_RESULTS_DIR.joinpath("benchmark.csv")))
+    args = parser.parse_args()
+
+    results = run_benchmark(args.systems, args.automaton_types, args.closing_strategies,
+                            args.cex_processing, args.repeats, num_steps=args.num_steps)
+    save_results(results, args.json, args.csv)
+    for system, result in fastest_configurations(results).items():
+        print(f"{system}: {result['automaton_type']} {result['closing_strategy']} "
+              f"{result['cex_processing']} {result['wall_time']}s")
+
+
+if __name__ == "__main__":
+    if not PATH_TO_RESULTS_DIR.exists():
+        PATH_TO_RESULTS_DIR.mkdir(parents=True)
+    main()
@@ -0,0 +1,146 @@
+from itertools import chain
+
+import numpy as np
+from aalpy.base import SUL
+
+from system_emulations.conformance_testing import automaton_type_of, load_model, state_label
+
+PADDING = -1
+
+
+class CompiledModel:
+    def __init__(self, automaton_type: str, inputs: list, outputs: list, transitions: np.ndarray,
+                 output_table: np.ndarray, initial_state: int = 0):
+        self.automaton_type = automaton_type
+        self.inputs = inputs
+        self.outputs = outputs
+        self.input_codes = {letter: code for code, letter in enumerate(inputs)}
+        self.output_codes = {output: code for code, output in enumerate(outputs)}
+        self._output_symbols = np.array(outputs + [None], dtype=object)
+        # transitions[state, input] -> state
+        self.transitions = transitions
+        # mealy: output_table[state, input], moore and dfa: output_table[state]
+        self.output_table = output_table
+        self.initial_state = initial_state
+        self.complete = bool((transitions != PADDING).all())
+        self._flat_transitions = transitions.ravel()
+        self._flat_outputs = output_table.ravel()
+
+    @classmethod
+    def from_automaton(cls, model) -> "CompiledModel":
+        automaton_type = automaton_type_of(model)
+        inputs = model.get_input_alphabet()
+        states = [model.initial_state] + [state for state in model.states if state is not model.initial_state]
+        state_ids = {state.state_id: index for index, state in enumerate(states)}
+        outputs = {}
+        transitions = np.full((len(states), len(inputs)), PADDING, dtype=np.int32)
+        if automaton_type == 'mealy':
+            output_table = np.full((len(states), len(inputs)), PADDING, dtype=np.int32)
+        else:
+            output_table = np.empty(len(states), dtype=np.int32)
+        for index, state in enumerate(states):
+            if automaton_type != 'mealy':
+                output_table[index] = outputs.setdefault(state_label(state, automaton_type), len(outputs))
+            for code, letter in enumerate(inputs):
+                target = state.transitions.get(letter)
+                if target is None:
+                    continue
+                transitions[index, code] = state_ids[target.state_id]
+                if automaton_type == 'mealy':
+                    output_table[index, code] = outputs.setdefault(state.output_fun[letter], len(outputs))
+        return cls(automaton_type, inputs, list(outputs), transitions, output_table)
+
+    @classmethod
+    def load(cls, path, automaton_type: str) -> "CompiledModel":
+        return cls.from_automaton(load_model(path, automaton_type))
+
+    @property
+    def states_num(self) -> int:
+        return len(self.transitions)
+
+    def encode(self, words: list) -> np.ndarray:
+        # words of different lengths are padded with PADDING at the end
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        letters = np.fromiter(map(self.input_codes.__getitem__, chain.from_iterable(words)),
+                              dtype=np.int32, count=int(lengths.sum()))
+        encoded = np.full((len(words), int(lengths.max(initial=0))), PADDING, dtype=np.int32)
+        encoded[np.arange(encoded.shape[1]) < lengths[:, None]] = letters
+        return encoded
+
+    def run(self, encoded: np.ndarray, states: np.ndarray | None = None) -> tuple:
+        # executes all words at once, one vectorized step per position over flattened
+        # tables, returns the output codes (PADDING after the end of a word) and the final states
+        words_num, length = encoded.shape
+        inputs_num = len(self.inputs)
+        states = np.full(words_num, self.initial_state, dtype=np.int32) if states is None else states.copy()
+        output_codes = np.full((words_num, length), PADDING, dtype=np.int32)
+        for position in range(length):
+            letters = encoded[:, position]
+            active = letters != PADDING
+            all_active = active.all()
+            if not all_active:
+                if not active.any():
+                    break
+                letters = np.where(active, letters, 0)
+            index = states * inputs_num + letters
+            targets = self._flat_transitions.take(index)
+            if not self.complete and (targets[active] == PADDING).any():
+                raise ValueError(f"the model has no transition for an input at position {position}")
+            if self.automaton_type == 'mealy':
+                step_outputs = self._flat_outputs.take(index)
+            else:
+                step_outputs = self._flat_outputs.take(targets)
+            if all_active:
+                output_codes[:, position] = step_outputs
+                states = targets
+            else:
+                output_codes[:, position] = np.where(active, step_outputs, PADDING)
+                states = np.where(active, targets, states)
+        return output_codes, states
+
+    def decode(self, output_codes: np.ndarray) -> list:
+        # PADDING picks the trailing None of the symbol array, rows are cut at the word length
+        rows = self._output_symbols[output_codes].tolist()
+        if not output_codes.size or output_codes[:, -1].min() != PADDING:
+            return rows
+        lengths = np.count_nonzero(output_codes != PADDING, axis=1).tolist()
+        return [row[:length] for row, length in zip(rows, lengths)]
+
+    def execute_batch(self, words: list) -> list:
+        return self.decode(self.run(self.encode(words))[0])
+
+    def random_walks(self, words_num: int, length: int, seed: int | None = None) -> tuple:
+        # what-if simulation over random input words, returns the input and output codes
+        encoded = np.random.default_rng(seed).integers(0, len(self.inputs), (words_num, length), dtype=np.int32)
+        return encoded, self.run(encoded)[0]
+
+
+class CompiledModelSUL(SUL):
+    # a learned model standing in for the controller, query_batch runs whole batches
+    # through the transition tables as BatchRandomWalkEqOracle expects
+    def __init__(self, model: CompiledModel):
+        super().__init__()
+        self.model = model
+        self._state = model.initial_state
+
+    def pre(self):
+        self._state = self.model.initial_state
+
+    def post(self):
+        pass
+
+    def step(self, letter):
+        model = self.model
+        if letter is None:
+            return model.outputs[model.output_table[self._state]] if model.automaton_type != 'mealy' else None
+        code = model.input_codes[letter]
+        target = int(model.transitions[self._state, code])
+        output = model.output_table[self._state, code] if model.automaton_type == 'mealy' \
+            else model.output_table[target]
+        self._state = target
+        return model.outputs[output]
+
+    def query_batch(self, words: list) -> list:
+        self.num_queries += len(words)
+        self.num_steps += sum(len(word) for word in words)
+        return self.model.execute_batch(words)
@@ -0,0 +1,243 @@
+import argparse
+import sys
+import time
+from itertools import product
+from pathlib import Path
+from typing import NamedTuple
+
+from aalpy.utils import load_automaton_from_file
+
+from system_emulations.parallel_queries import ParallelQueryExecutor
+from system_emulations.test_sul import SYSTEMS
+
+AUTOMATON_TYPES = {'Dfa': 'dfa', 'MooreMachine': 'moore', 'MealyMachine': 'mealy'}
+METHODS = ['w', 'wp', 'hsi']
+
+
+def model_file(path) -> Path:
+    # Automaton.save appends the .dot extension to the given path
+    path = Path(path)
+    return path if path.suffix == ".dot" else path.with_name(path.name + ".dot")
+
+
+def load_model(path, automaton_type: str):
+    model = load_automaton_from_file(str(model_file(path)), automaton_type)
+    model.compute_prefixes()
+    return model
+
+
+def automaton_type_of(model) -> str:
+    return AUTOMATON_TYPES[type(model).__name__]
+
+
+def state_label(state, automaton_type: str):
+    match automaton_type:
+        case 'dfa':
+            return state.is_accepting
+        case 'moore':
+            return state.output
+    return None
+
+
+def observed_outputs(outputs: list, automaton_type: str) -> list:
+    # saved models only keep the truth value of dfa outputs and read digit strings back as ints
+    if automaton_type == 'dfa':
+        return [bool(output) for output in outputs]
+    return [int(output) if isinstance(output, str) and output.isdigit() else output for output in outputs]
+
+
+def characterization_set(model, alphabet: list | None = None) -> list:
+    automaton_type = automaton_type_of(model)
+    model_alphabet = model.get_input_alphabet()
+    letters = [(letter,) for letter in alphabet or model_alphabet if letter in model_alphabet]
+    char_set_init = letters if automaton_type == 'mealy' else [()] + letters
+    suffixes = model.compute_characterization_set(char_set_init=list(char_set_init), raise_warning=False)
+    return sorted(suffixes or char_set_init, key=lambda suffix: (len(suffix), str(suffix)))
+
+
+def state_identifiers(model, suffixes: list) -> dict:
+    # per state, a few suffixes of the characterization set that together tell it apart
+    # from all other states, picked greedily by how many states each one rules out; the
+    # identification sets of the Wp method, they are not harmonized between states
+    automaton_type = automaton_type_of(model)
+    blocks = []
+    for suffix in suffixes:
+        partition = {}
+        for state in model.states:
+            response = (state_label(state, automaton_type), *model.compute_output_seq(state, suffix))
+            partition.setdefault(response, set()).add(state.state_id)
+        blocks.append({state_id: block for block in partition.values() for state_id in block})
+
+    identifiers = {}
+    for state in model.states:
+        remaining = {other.state_id for other in model.states}
+        identifiers[state.state_id] = chosen = []
+        while len(remaining) > 1:
+            index = min(range(len(suffixes)), key=lambda i: len(remaining & blocks[i][state.state_id]))
+            narrowed = remaining & blocks[index][state.state_id]
+            if len(narrowed) == len(remaining):
+                break
+            chosen.append(suffixes[index])
+            remaining = narrowed
+    return identifiers
+
+
+def harmonized_identifiers(model, suffixes: list) -> dict:
+    # splitting tree over the characterization set: a block of states that a suffix splits gives
+    # that suffix to all its states, so every pair of states shares the suffix that separates them
+    automaton_type = automaton_type_of(model)
+    responses = [{state.state_id: (state_label(state, automaton_type), *model.compute_output_seq(state, suffix))
+                  for state in model.states} for suffix in suffixes]
+    identifiers = {state.state_id: [] for state in model.states}
+    blocks = [list(identifiers)]
+    while blocks:
+        block = blocks.pop()
+        best = None
+        for index, response in enumerate(responses):
+            parts = {}
+            for state_id in block:
+                parts.setdefault(response[state_id], []).append(state_id)
+            if len(parts) > 1 and (best is None or len(parts) > len(best[1])):
+                best = index, parts
+        if best is None:
+            # equivalent states or a single one
+            continue
+        for state_id in block:
+            identifiers[state_id].append(suffixes[best[0]])
+        blocks.extend(part for part in best[1].values() if len(part) > 1)
+    return identifiers
+
+
+def maximal_words(words) -> list:
+    # the outputs of a word are a prefix of the outputs of its extensions, so only words
+    # that are not a prefix of another one need to be executed
+    trie = {}
+    kept = []
+    for word in sorted(set(words), key=len, reverse=True):
+        node = trie
+        new = False
+        for letter in word:
+            child = node.get(letter)
+            if child is None:
+                child = node[letter] = {}
+                new = True
+            node = child
+        if new:
+            kept.append(word)
+    return kept
+
+
+def conformance_suite(model, method: str = 'wp', extra_states: int = 0, suffixes: list | None = None) -> list:
+    # w:   transition cover . alphabet^<=extra_states . W
+    # wp:  state cover . alphabet^<=extra_states . W, and the other transitions followed by
+    #      the identifiers of the state they reach
+    # hsi: harmonized identifiers after every state and transition, no full W
+    if method not in METHODS:
+        raise ValueError(f"unknown test method {method}")
+    if model.initial_state.prefix is None:
+        model.compute_prefixes()
+    alphabet = model.get_input_alphabet()
+    suffixes = suffixes if suffixes is not None else characterization_set(model)
+    match method:
+        case 'wp':
+            identifiers = state_identifiers(model, suffixes)
+        case 'hsi':
+            identifiers = harmonized_identifiers(model, suffixes)
+        case _:
+            identifiers = None
+    middles = [middle for length in range(extra_states + 1) for middle in product(alphabet, repeat=length)]
+
+    def reached(state, middle):
+        for letter in middle:
+            state = state.transitions[letter]
+        return state
+
+    words = []
+    for state in model.states:
+        for middle in middles:
+            target = reached(state, middle)
+            tails = (identifiers[target.state_id] or [()]) if method == 'hsi' else suffixes
+            words.extend(state.prefix + middle + tail for tail in tails)
+        for letter in alphabet:
+            for middle in middles:
+                target = reached(state.transitions[letter], middle)
+                tails = suffixes if method == 'w' else (identifiers[target.state_id] or [()])
+                words.extend(state.prefix + (letter,) + middle + tail for tail in tails)
+    return words
+
+
+class Divergence(NamedTuple):
+    word: tuple
+    expected: list
+    observed: list
+
+
+class ConformanceReport(NamedTuple):
+    tests: int
+    executed: int
+    steps: int
+    elapsed: float
+    divergences: list
+
+    @property
+    def passed(self) -> bool:
+        return not self.divergences
+
+
+def execute_words(sul_class, words: list, processes: int | None = None, chunk_size: int = 64) -> list:
+    if processes == 1:
+        sul = sul_class()
+        return [sul.query(word) for word in words]
+    with ParallelQueryExecutor(sul_class, processes, chunk_size) as executor:
+        return executor.query_batch(words)
+
+
+def run_test_suite(model, sul_class, method: str = 'wp', extra_states: int = 0,
+                   processes: int | None = None, chunk_size: int = 64) -> ConformanceReport:
+    start = time.perf_counter()
+    automaton_type = automaton_type_of(model)
+    words = conformance_suite(model, method, extra_states)
+    executed = maximal_words(words)
+    if automaton_type != 'mealy':
+        # the label of the initial state, observed by L* through the empty word
+        executed.append(())
+
+    divergences = {}
+    for word, outputs in zip(executed, execute_words(sul_class, executed, processes, chunk_size)):
+        expected = model.execute_sequence(model.initial_state, word) if word \
+            else [state_label(model.initial_state, automaton_type)]
+        observed = observed_outputs(outputs, automaton_type)
+        mismatch = next((i for i, pair in enumerate(zip(expected, observed)) if pair[0] != pair[1]), None)
+        if mismatch is not None:
+            # words sharing the diverging prefix are reported once
+            divergences.setdefault(word[:mismatch + 1],
+                                   Divergence(word[:mismatch + 1], expected[:mismatch + 1], observed[:mismatch + 1]))
+    return ConformanceReport(len(set(words)), len(executed), sum(map(len, executed)),
+                             time.perf_counter() - start, sorted(divergences.values(), key=lambda d: len(d.word)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model")
+    parser.add_argument("--system", choices=list(SYSTEMS), required=True)
+    parser.add_argument("--automaton-type", choices=list(AUTOMATON_TYPES.values()), default='mealy')
+    parser.add_argument("--method", choices=METHODS, default='wp')
+    parser.add_argument("--extra-states", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    parser.add_argument("--show", type=int, default=10)
+    args = parser.parse_args()
+
+    model = load_model(args.model, args.automaton_type)
+    report = run_test_suite(model, SYSTEMS[args.system][0], args.method, args.extra_states,
+                            args.processes, args.chunk_size)
+    print(f"{report.tests} tests, {report.executed} words, {report.steps} steps "
+          f"in {report.elapsed:.2f}s: {len(report.divergences)} divergences")
+    for divergence in report.divergences[:args.show]:
+        print(f"  {' '.join(map(str, divergence.word))}: expected {divergence.expected[-1]!r}, "
+              f"observed {divergence.observed[-1]!r}")
+    sys.exit(0 if report.passed else 1)
+
+
+if __name__ == "__main__":
+    main()
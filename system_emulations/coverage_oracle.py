@@ -0,0 +1,95 @@
+import random
+from collections import deque
+
+from aalpy.base import Oracle, SUL
+
+
+class CoverageGuidedEqOracle(Oracle):
+    def __init__(self, alphabet: list, sul: SUL, num_steps: int = 5000,
+                 reset_prob: float = 0.09, guidance_prob: float = 0.8, patience: int = 200):
+        super().__init__(alphabet, sul)
+        self.step_limit = num_steps
+        self.reset_prob = reset_prob
+        # probability of following the path to an uncovered transition instead of a random letter
+        self.guidance_prob = guidance_prob
+        # steps without new coverage after which the search is considered saturated
+        self.patience = patience
+        # (letter, output) pairs seen on the SUL, each one stands for a controller branch
+        self.sul_branches = set()
+        self.covered_transitions = set()
+        self.covered_states = set()
+        self._transitions_count = 0
+
+    def _path_to_uncovered(self, hypothesis, origin) -> list:
+        visited = {origin.state_id}
+        queue = deque([(origin, [])])
+        while queue:
+            state, path = queue.popleft()
+            for letter in self.alphabet:
+                if (state.state_id, letter) not in self.covered_transitions:
+                    return path + [letter]
+            for letter in self.alphabet:
+                target = state.transitions.get(letter)
+                if target is not None and target.state_id not in visited:
+                    visited.add(target.state_id)
+                    queue.append((target, path + [letter]))
+        return []
+
+    def _choose_letter(self, hypothesis, plan: list):
+        if random.random() <= self.guidance_prob:
+            if not plan and len(self.covered_transitions) < self._transitions_count:
+                plan.extend(self._path_to_uncovered(hypothesis, hypothesis.current_state))
+            if plan:
+                return plan.pop(0)
+        plan.clear()
+        return random.choice(self.alphabet)
+
+    def find_cex(self, hypothesis):
+        self.covered_transitions = set()
+        self.covered_states = set()
+        self._transitions_count = len(hypothesis.states) * len(self.alphabet)
+
+        inputs = []
+        plan = []
+        idle_steps = 0
+        self.reset_hyp_and_sul(hypothesis)
+        self.covered_states.add(hypothesis.current_state.state_id)
+
+        for _ in range(self.step_limit):
+            if idle_steps >= self.patience and len(self.covered_transitions) == self._transitions_count:
+                break
+
+            if random.random() <= self.reset_prob:
+                self.reset_hyp_and_sul(hypothesis)
+                inputs.clear()
+                plan.clear()
+
+            letter = self._choose_letter(hypothesis, plan)
+            inputs.append(letter)
+            source = hypothesis.current_state.state_id
+
+            self.num_steps += 1
+            out_sul = self.sul.step(letter)
+            out_hyp = hypothesis.step(letter)
+
+            new_coverage = (letter, out_sul) not in self.sul_branches or \
+                (source, letter) not in self.covered_transitions or \
+                hypothesis.current_state.state_id not in self.covered_states
+            self.sul_branches.add((letter, out_sul))
+            self.covered_transitions.add((source, letter))
+            self.covered_states.add(hypothesis.current_state.state_id)
+            idle_steps = 0 if new_coverage else idle_steps + 1
+
+            if out_sul != out_hyp:
+                self.sul.post()
+                return inputs
+
+        self.sul.post()
+        return None
+
+    def coverage(self, hypothesis) -> dict:
+        return {
+            'states': len(self.covered_states) / len(hypothesis.states),
+            'transitions': len(self.covered_transitions) / (len(hypothesis.states) * len(self.alphabet)),
+            'sul_branches': len(self.sul_branches),
+        }
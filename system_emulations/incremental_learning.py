@@ -0,0 +1,342 @@
+import time
+from collections import deque
+from typing import NamedTuple
+
+from aalpy.base import Oracle, SUL
+from aalpy.base.SUL import CacheSUL
+from aalpy.learning_algs import run_Lstar
+from aalpy.learning_algs.deterministic.CounterExampleProcessing import counterexample_successfully_processed
+from aalpy.learning_algs.deterministic.ObservationTable import ObservationTable
+from aalpy.utils.HelperFunctions import extend_set, print_learning_info
+
+from system_emulations.conformance_testing import automaton_type_of, characterization_set, \
+    conformance_suite, load_model, maximal_words, model_file, observed_outputs, state_label
+from system_emulations.parallel_queries import process_cex
+from system_emulations.query_cache import CachingSUL, QueryTrie
+
+
+def _model_path(model, word, automaton_type: str) -> list | None:
+    # (state, letter, output) for every step of word, None if the model has no such transition
+    state = model.initial_state
+    path = []
+    for letter in word:
+        target = state.transitions.get(letter)
+        if target is None:
+            return None
+        output = state.output_fun[letter] if automaton_type == 'mealy' else state_label(target, automaton_type)
+        path.append((state, letter, output))
+        state = target
+    return path
+
+
+class ObservedSUL(SUL):
+    # the boundary to the SUL: its outputs are read the way a saved model reads its own, so
+    # answers of the model and of the SUL can be compared and mixed in one observation table,
+    # the raw answers also go to cache
+    def __init__(self, sul: SUL, automaton_type: str, cache: QueryTrie | None = None):
+        super().__init__()
+        self.sul = sul
+        self.automaton_type = automaton_type
+        self.cache = cache
+
+    def query(self, word: tuple) -> list:
+        answer = self.sul.query(word)
+        if self.cache is not None:
+            # the empty word is answered by step(None), as in CachingSUL
+            key = word if len(word) else (None,)
+            if self.cache.lookup(key) not in (None, answer):
+                # the cache was filled by another version of the system, none of its answers can be trusted
+                self.cache.root.clear()
+            self.cache.insert(key, answer)
+        self.num_queries += 1
+        self.num_steps += len(word)
+        return observed_outputs(answer, self.automaton_type)
+
+    def pre(self):
+        self.sul.pre()
+
+    def post(self):
+        self.sul.post()
+
+    def step(self, letter):
+        return observed_outputs([self.sul.step(letter)], self.automaton_type)[0]
+
+
+class ModelBackedSUL(SUL):
+    # answers membership queries from the saved model while they only take transitions that
+    # were not found to diverge from the SUL, everything else is asked to the SUL
+    def __init__(self, sul: SUL, model, automaton_type: str):
+        super().__init__()
+        self.sul = sul
+        self.model = model
+        self.automaton_type = automaton_type
+        self.diverged = set()
+        self.trusted = True
+        self.num_model_queries = 0
+
+    def uses(self, word, transitions: set) -> bool:
+        path = _model_path(self.model, word, self.automaton_type)
+        return path is not None and any((state.state_id, letter) in transitions for state, letter, _ in path)
+
+    def query(self, word: tuple) -> list:
+        if self.trusted and word:
+            path = _model_path(self.model, word, self.automaton_type)
+            if path is not None and not any((state.state_id, letter) in self.diverged for state, letter, _ in path):
+                self.num_model_queries += 1
+                return [output for _, _, output in path]
+        self.num_queries += 1
+        self.num_steps += len(word)
+        return self.sul.query(word)
+
+    def pre(self):
+        self.sul.pre()
+
+    def post(self):
+        self.sul.post()
+
+    def step(self, letter):
+        return self.sul.step(letter)
+
+
+def localize_divergence(model, automaton_type: str, sul: SUL, word: tuple, sul_outputs: list):
+    # Rivest-Schapire style search for the model transition on word after which the SUL
+    # disagrees, returns (state id, letter) or None if the model agrees with the SUL on word
+    path = _model_path(model, word, automaton_type)
+    if path is None:
+        return None
+    mismatch = next((i for i, (_, _, output) in enumerate(path) if output != sul_outputs[i]), None)
+    if mismatch is None:
+        return None
+
+    def agrees(i: int) -> bool:
+        return sul.query(path[i][0].prefix + word[i:mismatch + 1])[-1] == path[mismatch][2]
+
+    low, high = 0, mismatch + 1
+    while high - low > 1:
+        middle = (low + high) // 2
+        if agrees(middle):
+            high = middle
+        else:
+            low = middle
+    return path[low][0].state_id, path[low][1]
+
+
+class ConformanceResult(NamedTuple):
+    tests: int
+    failing: list
+    diverged: set
+    characterization_set: list
+
+
+def check_conformance(model, sul: SUL, alphabet: list) -> ConformanceResult:
+    # runs an HSI-method suite of the saved model on the SUL, which answers like an ObservedSUL,
+    # and traces the failing words back to the model transitions where the SUL starts to disagree
+    automaton_type = automaton_type_of(model)
+    suffixes = characterization_set(model, alphabet)
+
+    outputs = QueryTrie()
+    failing = []
+    tests = maximal_words(conformance_suite(model, 'hsi', suffixes=suffixes))
+    for word in tests:
+        sul_outputs = list(sul.query(word))
+        outputs.insert(word, sul_outputs)
+        if [output for _, _, output in _model_path(model, word, automaton_type)] != sul_outputs:
+            failing.append(word)
+    if automaton_type != 'mealy':
+        if sul.query(())[-1] != state_label(model.initial_state, automaton_type):
+            failing.append(())
+
+    diverged = set()
+    failing.sort(key=len)
+    for word in failing:
+        path = _model_path(model, word, automaton_type)
+        if not word or any((state.state_id, letter) in diverged for state, letter, _ in path):
+            continue
+        transition = localize_divergence(model, automaton_type, sul, word, outputs.lookup(word))
+        if transition is not None:
+            diverged.add(transition)
+    return ConformanceResult(len(tests), failing, diverged, suffixes)
+
+
+def _drop_equal_rows(table: ObservationTable) -> None:
+    # access sequences whose rows the SUL no longer tells apart keep only the shortest one,
+    # gen_hypothesis makes a state of every prefix in S
+    rows = set()
+    table.S = [prefix for prefix in table.S if not (table.T[prefix] in rows or rows.add(table.T[prefix]))]
+    table.update_obs_table()
+
+
+def _refresh_table(table: ObservationTable, backed_sul: ModelBackedSUL, transitions: set | None) -> None:
+    # drops the rows with cells answered through transitions that turned out to diverge
+    for prefix in list(table.T):
+        if transitions is None or any(backed_sul.uses(prefix + suffix, transitions) for suffix in table.E):
+            del table.T[prefix]
+    table.update_obs_table()
+    _drop_equal_rows(table)
+
+
+def run_incremental_Lstar(alphabet: list, sul: SUL, eq_oracle: Oracle, automaton_type: str, model,
+                          closing_strategy: str = 'shortest_first', cex_processing: str = 'rs',
+                          e_set_suffix_closed: bool = False, all_prefixes_in_obs_table: bool = True,
+                          max_learning_rounds: int | None = None, cache_and_non_det_check: bool = True,
+                          max_failing_ratio: float = 0.5, return_data: bool = False, print_level: int = 2):
+    if cex_processing is None:
+        raise ValueError("incremental learning needs a counterexample processing strategy")
+    if automaton_type == 'dfa':
+        raise ValueError("incremental learning does not support dfa: a saved dfa only keeps whether its states "
+                         "accept, not the outputs of the SUL it was learned from, so they cannot be compared")
+    # a persisted cache may hold answers of an older version of the system, so the saved model
+    # is checked against the live one and its answers are taken over by the cache
+    live_sul = ObservedSUL(sul.sul, automaton_type, sul.cache) if isinstance(sul, CachingSUL) else None
+    sul = ObservedSUL(sul, automaton_type)
+    if cache_and_non_det_check:
+        sul = CacheSUL(sul)
+    eq_oracle.sul = sul
+
+    start_time = time.time()
+    eq_query_time = 0
+    learning_rounds = 0
+
+    if live_sul is not None:
+        tests, failing, diverged, characterization_set = check_conformance(model, live_sul, alphabet)
+        conformance_queries, conformance_steps = live_sul.num_queries, live_sul.num_steps
+    else:
+        tests, failing, diverged, characterization_set = check_conformance(model, sul, alphabet)
+        conformance_queries, conformance_steps = sul.num_queries, sul.num_steps
+    new_letters = set(alphabet) - set(model.get_input_alphabet())
+    if print_level > 1:
+        print(f'Saved model: {len(model.states)} states, {len(failing)} of {tests} tests failing, '
+              f'{len(diverged)} diverging transitions.')
+
+    hypothesis = model
+    backed_sul = ModelBackedSUL(sul, model, automaton_type)
+    backed_sul.diverged = diverged
+    if not failing and not new_letters:
+        # the suite only reaches as deep as the saved model, changes beyond it are left to the oracle
+        eq_query_start = time.time()
+        cex = eq_oracle.find_cex(model)
+        eq_query_time += time.time() - eq_query_start
+        if cex is not None:
+            cex = tuple(cex)
+            sul_outputs = sul.query(cex)
+            mismatch = next((i for i, (_, _, output) in enumerate(_model_path(model, cex, automaton_type))
+                             if output != sul_outputs[i]), None)
+            if mismatch is not None:
+                failing = [cex[:mismatch + 1]]
+                transition = localize_divergence(model, automaton_type, sul, failing[0], sul_outputs)
+                if transition is not None:
+                    diverged.add(transition)
+            if print_level > 1:
+                print(f'Saved model: equivalence oracle {"found" if failing else "found no real"} counterexample.')
+    if len(failing) > max_failing_ratio * tests:
+        # most of the saved model is stale, repairing it costs more than learning from scratch,
+        # the conformance queries are still answered from the cache
+        hypothesis, data = run_Lstar(alphabet, sul, eq_oracle, automaton_type, closing_strategy=closing_strategy,
+                                     cex_processing=cex_processing, e_set_suffix_closed=e_set_suffix_closed,
+                                     all_prefixes_in_obs_table=all_prefixes_in_obs_table,
+                                     max_learning_rounds=max_learning_rounds, cache_and_non_det_check=False,
+                                     return_data=True, print_level=0)
+        learning_rounds = data['learning_rounds']
+        eq_query_time = data['eq_oracle_time']
+    elif failing or new_letters:
+        table = ObservationTable(alphabet, backed_sul, automaton_type, all_prefixes_in_obs_table)
+        table.S = [()] + sorted((state.prefix for state in model.states if state.prefix), key=len)
+        extend_set(table.E, [suffix for suffix in characterization_set if suffix])
+        table.update_obs_table()
+        _drop_equal_rows(table)
+
+        pending = deque(word for word in failing if word)
+        cex = None
+        failed_processing = 0
+        while True:
+            if max_learning_rounds and learning_rounds == max_learning_rounds:
+                break
+
+            rows_to_close = table.get_rows_to_close(closing_strategy)
+            while rows_to_close is not None:
+                rows_to_query = []
+                for row in rows_to_close:
+                    table.S.append(row)
+                    rows_to_query.extend([row + (a,) for a in alphabet])
+                table.update_obs_table(s_set=rows_to_query)
+                rows_to_close = table.get_rows_to_close(closing_strategy)
+
+            hypothesis = table.gen_hypothesis()
+            if cex is None or counterexample_successfully_processed(sul, cex, hypothesis):
+                failed_processing = 0
+                learning_rounds += 1
+                if print_level > 1:
+                    print(f'Hypothesis {learning_rounds}: {len(hypothesis.states)} states.')
+                # the failing tests of the saved model are tried before the equivalence oracle
+                cex = None
+                while pending and cex is None:
+                    word = pending.popleft()
+                    outputs = zip(hypothesis.execute_sequence(hypothesis.initial_state, word), sul.query(word))
+                    mismatch = next((i for i, (expected, output) in enumerate(outputs) if expected != output), None)
+                    if mismatch is not None:
+                        cex = word[:mismatch + 1]
+                if cex is None:
+                    eq_query_start = time.time()
+                    cex = eq_oracle.find_cex(hypothesis)
+                    eq_query_time += time.time() - eq_query_start
+                if cex is None:
+                    if not backed_sul.trusted or not backed_sul.num_model_queries:
+                        break
+                    # the saved model answered cells the oracle did not get to, the hypothesis
+                    # is only accepted once it is built from answers of the SUL
+                    backed_sul.trusted = False
+                    _refresh_table(table, backed_sul, None)
+                    continue
+                cex = tuple(cex)
+                transition = localize_divergence(model, automaton_type, sul, cex, sul.query(cex))
+                if transition is not None and transition not in backed_sul.diverged:
+                    backed_sul.diverged.add(transition)
+                    _refresh_table(table, backed_sul, {transition})
+            else:
+                failed_processing += 1
+                if failed_processing > 1 and backed_sul.trusted:
+                    # the saved model keeps misleading the table, continue as plain L*
+                    backed_sul.trusted = False
+                    _refresh_table(table, backed_sul, None)
+
+            added_suffixes = extend_set(table.E, process_cex(cex_processing, table, backed_sul, cex,
+                                                             hypothesis, e_set_suffix_closed))
+            table.update_obs_table(e_set=added_suffixes)
+
+    total_time = round(time.time() - start_time, 2)
+    eq_query_time = round(eq_query_time, 2)
+    info = {
+        'learning_rounds': learning_rounds,
+        'automaton_size': hypothesis.size,
+        'saved_model_size': model.size,
+        'failing_tests': len(failing),
+        'diverging_transitions': len(backed_sul.diverged),
+        'queries_conformance': conformance_queries,
+        'steps_conformance': conformance_steps,
+        'queries_answered_by_model': backed_sul.num_model_queries,
+        'queries_learning': sul.num_queries,
+        'steps_learning': sul.num_steps,
+        'queries_eq_oracle': eq_oracle.num_queries,
+        'steps_eq_oracle': eq_oracle.num_steps,
+        'learning_time': round(total_time - eq_query_time, 2),
+        'eq_oracle_time': eq_query_time,
+        'total_time': total_time,
+    }
+    if cache_and_non_det_check:
+        info['cache_saved'] = sul.num_cached_queries
+
+    if print_level > 0:
+        print_learning_info(info)
+    if return_data:
+        return hypothesis, info
+    return hypothesis
+
+
+def relearn(model_path, alphabet: list, sul: SUL, eq_oracle: Oracle, automaton_type: str, **kwargs):
+    # repairs the model saved at model_path if there is one, learns from scratch otherwise
+    if automaton_type == 'dfa':
+        raise ValueError("incremental learning does not support dfa")
+    if model_file(model_path).exists():
+        model = load_model(model_path, automaton_type)
+        return run_incremental_Lstar(alphabet, sul, eq_oracle, automaton_type, model, **kwargs)
+    return run_Lstar(alphabet, sul, eq_oracle, automaton_type, **kwargs)
@@ -0,0 +1,114 @@
+import json
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# upper bounds of the latency histogram buckets, in microseconds
+LATENCY_BUCKETS_US = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# commands outside a handler's opcode table share one metric
+UNKNOWN_COMMAND = "unknown"
+
+
+def _label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time_ns = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_US) + 1)
+
+    def observe(self, elapsed_ns: int, error: bool = False) -> None:
+        self.calls += 1
+        self.errors += error
+        self.total_time_ns += elapsed_ns
+        self.buckets[bisect_left(LATENCY_BUCKETS_US, elapsed_ns / 1000)] += 1
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': self.errors / self.calls if self.calls else 0.0,
+            'total_time_ns': self.total_time_ns,
+            'histogram_us': dict(zip([*map(str, LATENCY_BUCKETS_US), '+Inf'], self.buckets))
+        }
+
+
+class InstrumentationRegistry:
+    def __init__(self):
+        self.enabled = False
+        self.metrics = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        self.metrics.clear()
+
+    def metric(self, name: str) -> Metric:
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = Metric()
+        return metric
+
+    def dump(self) -> dict:
+        return {name: metric.to_dict() for name, metric in sorted(self.metrics.items())}
+
+    def dumps(self) -> str:
+        return json.dumps(self.dump())
+
+    def scrape(self) -> str:
+        # Prometheus text exposition format
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            labels = f'name="{_label_value(name)}"'
+            lines.append(f'emulator_calls_total{{{labels}}} {metric.calls}')
+            lines.append(f'emulator_errors_total{{{labels}}} {metric.errors}')
+            lines.append(f'emulator_latency_seconds_sum{{{labels}}} {metric.total_time_ns / 1e9}')
+            cumulative = 0
+            for bound, count in zip([*(b / 1e6 for b in LATENCY_BUCKETS_US), '+Inf'], metric.buckets):
+                cumulative += count
+                lines.append(f'emulator_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'emulator_latency_seconds_count{{{labels}}} {metric.calls}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = InstrumentationRegistry()
+
+
+def instrumented_handler(system_name: str, command_index: int, command_name: str, opcodes: dict, is_error):
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            if not REGISTRY.enabled:
+                return handler(*args, **kwargs)
+            start = time.perf_counter_ns()
+            result = handler(*args, **kwargs)
+            elapsed = time.perf_counter_ns() - start
+            command = args[command_index] if len(args) > command_index else kwargs.get(command_name)
+            # keyed on the opcode table, arbitrary client input must not create new metrics
+            if not isinstance(command, str) or command not in opcodes:
+                command = UNKNOWN_COMMAND
+            REGISTRY.metric(f"{system_name}.{command}").observe(elapsed, is_error(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def timed(name: str):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not REGISTRY.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            result = func(*args, **kwargs)
+            REGISTRY.metric(name).observe(time.perf_counter_ns() - start)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,220 @@
+import random
+import time
+from itertools import product
+from multiprocessing import Pool
+
+from aalpy.base import SUL, Oracle
+from aalpy.learning_algs.deterministic.CounterExampleProcessing import rs_cex_processing, \
+    longest_prefix_cex_processing, linear_cex_processing, exponential_cex_processing, \
+    counterexample_successfully_processed
+from aalpy.learning_algs.deterministic.ObservationTable import ObservationTable
+from aalpy.utils.HelperFunctions import extend_set, print_learning_info
+
+from system_emulations.query_cache import QueryTrie
+
+_worker_sul = None
+
+
+def _init_worker(sul_class):
+    global _worker_sul
+    _worker_sul = sul_class()
+
+
+def _run_queries(words: list) -> list:
+    return [_worker_sul.query(word) for word in words]
+
+
+class ParallelQueryExecutor:
+    def __init__(self, sul_class, processes: int | None = None, chunk_size: int = 64):
+        self.chunk_size = chunk_size
+        self._pool = Pool(processes, initializer=_init_worker, initargs=(sul_class,))
+
+    def query_batch(self, words: list) -> list:
+        chunks = [words[i:i + self.chunk_size] for i in range(0, len(words), self.chunk_size)]
+        return [outputs for chunk in self._pool.map(_run_queries, chunks) for outputs in chunk]
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ParallelSUL(SUL):
+    # answers queries from the batches already run in the pool, a query that was not part
+    # of any batch runs on the local SUL
+    def __init__(self, sul_class, processes: int | None = None, chunk_size: int = 64):
+        super().__init__()
+        self.sul = sul_class()
+        self.executor = ParallelQueryExecutor(sul_class, processes, chunk_size)
+        self.cache = QueryTrie()
+
+    def pre(self):
+        self.sul.pre()
+
+    def post(self):
+        self.sul.post()
+
+    def step(self, letter):
+        return self.sul.step(letter)
+
+    def query(self, word: tuple) -> list:
+        # the empty word is answered by step(None), as in SUL.query
+        key = word if len(word) else (None,)
+        outputs = self.cache.lookup(key)
+        if outputs is not None:
+            self.num_cached_queries += 1
+            return outputs
+        outputs = super().query(word)
+        self.cache.insert(key, outputs)
+        return outputs
+
+    def query_batch(self, words: list) -> list:
+        outputs = self.executor.query_batch(words)
+        self.num_queries += len(words)
+        self.num_steps += sum(len(word) for word in words)
+        return outputs
+
+    def prefetch(self, words) -> None:
+        # runs the words not answered yet in one batch, later queries of them and of their prefixes are cached
+        words = [word for word in dict.fromkeys(words) if self.cache.lookup(word if len(word) else (None,)) is None]
+        for word, outputs in zip(words, self.query_batch(words)):
+            self.cache.insert(word if len(word) else (None,), outputs)
+
+    def samples(self, alphabet: list, max_length: int = 2) -> list:
+        # all words up to max_length, to prefill the observation table
+        # through run_Lstar(..., samples=...)
+        words = [word for length in range(1, max_length + 1)
+                 for word in product(alphabet, repeat=length)]
+        return list(zip(words, self.query_batch(words)))
+
+    def close(self):
+        self.executor.close()
+
+
+class BatchObservationTable(ObservationTable):
+    # sends the cells an update is missing to the pool as one batch before the table reads them
+    def update_obs_table(self, s_set: list = None, e_set: list = None):
+        update_s = s_set if s_set else list(self.S) + list(self.s_dot_a())
+        update_e = e_set if e_set else self.E
+        self.sul.prefetch(s + e for s in update_s if len(self.T[s]) != len(self.E) for e in update_e)
+        super().update_obs_table(s_set, e_set)
+
+
+def process_cex(cex_processing: str, table: ObservationTable, sul: SUL, cex: tuple, hypothesis,
+                e_set_suffix_closed: bool) -> list:
+    match cex_processing:
+        case 'rs':
+            return rs_cex_processing(sul, cex, hypothesis, e_set_suffix_closed, closedness='suffix')
+        case 'longest_prefix':
+            return longest_prefix_cex_processing(table.S + list(table.s_dot_a()), cex, closedness='suffix')
+        case _:
+            direction = cex_processing[-3:]
+            if 'linear' in cex_processing:
+                return linear_cex_processing(sul, cex, hypothesis, e_set_suffix_closed,
+                                             direction=direction, closedness='suffix')
+            return exponential_cex_processing(sul, cex, hypothesis, e_set_suffix_closed,
+                                              direction=direction, closedness='suffix')
+
+
+def run_parallel_Lstar(alphabet: list, sul: ParallelSUL, eq_oracle: Oracle, automaton_type: str,
+                       closing_strategy: str = 'shortest_first', cex_processing: str = 'rs',
+                       e_set_suffix_closed: bool = False, all_prefixes_in_obs_table: bool = True,
+                       max_learning_rounds: int | None = None, return_data: bool = False, print_level: int = 2):
+    # run_Lstar with the observation table filled through the pool, a round of closing or a
+    # processed counterexample is one batch of membership queries
+    if cex_processing is None:
+        raise ValueError("parallel learning needs a counterexample processing strategy")
+    start_time = time.time()
+    eq_query_time = 0
+    learning_rounds = 0
+
+    table = BatchObservationTable(alphabet, sul, automaton_type, all_prefixes_in_obs_table)
+    table.update_obs_table()
+    cex = None
+    while True:
+        if max_learning_rounds and learning_rounds == max_learning_rounds:
+            break
+
+        rows_to_close = table.get_rows_to_close(closing_strategy)
+        while rows_to_close is not None:
+            rows_to_query = []
+            for row in rows_to_close:
+                table.S.append(row)
+                rows_to_query.extend([row + (a,) for a in alphabet])
+            table.update_obs_table(s_set=rows_to_query)
+            rows_to_close = table.get_rows_to_close(closing_strategy)
+
+        hypothesis = table.gen_hypothesis()
+        if cex is None or counterexample_successfully_processed(sul, cex, hypothesis):
+            learning_rounds += 1
+            if print_level > 1:
+                print(f'Hypothesis {learning_rounds}: {len(hypothesis.states)} states.')
+            eq_query_start = time.time()
+            cex = eq_oracle.find_cex(hypothesis)
+            eq_query_time += time.time() - eq_query_start
+        if cex is None:
+            break
+
+        cex = tuple(cex)
+        added_suffixes = extend_set(table.E, process_cex(cex_processing, table, sul, cex, hypothesis,
+                                                         e_set_suffix_closed))
+        table.update_obs_table(e_set=added_suffixes)
+
+    total_time = round(time.time() - start_time, 2)
+    eq_query_time = round(eq_query_time, 2)
+    info = {
+        'learning_rounds': learning_rounds,
+        'automaton_size': hypothesis.size,
+        'queries_learning': sul.num_queries,
+        'steps_learning': sul.num_steps,
+        'queries_eq_oracle': eq_oracle.num_queries,
+        'steps_eq_oracle': eq_oracle.num_steps,
+        'learning_time': round(total_time - eq_query_time, 2),
+        'eq_oracle_time': eq_query_time,
+        'total_time': total_time,
+        'cache_saved': sul.num_cached_queries,
+    }
+    if print_level > 0:
+        print_learning_info(info)
+    if return_data:
+        return hypothesis, info
+    return hypothesis
+
+
+class BatchRandomWalkEqOracle(Oracle):
+    def __init__(self, alphabet: list, sul: ParallelSUL, num_steps: int = 5000,
+                 reset_prob: float = 0.09, batch_size: int = 256):
+        super().__init__(alphabet, sul)
+        # run_Lstar replaces self.sul with its CacheSUL wrapper
+        self.parallel_sul = sul
+        self.step_limit = num_steps
+        self.reset_prob = reset_prob
+        self.batch_size = batch_size
+
+    def _random_word(self) -> tuple:
+        word = [random.choice(self.alphabet)]
+        while random.random() > self.reset_prob:
+            word.append(random.choice(self.alphabet))
+        return tuple(word)
+
+    def find_cex(self, hypothesis):
+        steps_done = 0
+        while steps_done < self.step_limit:
+            words = []
+            while len(words) < self.batch_size and steps_done < self.step_limit:
+                words.append(self._random_word())
+                steps_done += len(words[-1])
+
+            self.num_queries += len(words)
+            self.num_steps += sum(len(word) for word in words)
+            for word, out_sul in zip(words, self.parallel_sul.query_batch(words)):
+                out_hyp = hypothesis.execute_sequence(hypothesis.initial_state, word)
+                for i, (sul_output, hyp_output) in enumerate(zip(out_sul, out_hyp)):
+                    if sul_output != hyp_output:
+                        return word[:i + 1]
+        return None
@@ -0,0 +1,161 @@
+import heapq
+
+from aalpy.automata import MealyMachine, MealyState
+
+from system_emulations.trace_log import SYSTEMS, SYSTEM_IDS, TICK_OPCODE, NO_STATE_HASH, read_trace, \
+    decode_command, state_hash
+
+
+class PrefixTreeAcceptor:
+    def __init__(self, max_nodes: int | None = None):
+        # node -> {input symbol: (output symbol, child node)}
+        self.transitions = [{}]
+        self.max_nodes = max_nodes
+        self.truncated_traces = 0
+        self._inputs = {}
+        self._outputs = {}
+
+    def _symbol(self, table: dict, value) -> int:
+        symbol = table.get(value)
+        if symbol is None:
+            symbol = table[value] = len(table)
+        return symbol
+
+    def add_trace(self, trace) -> None:
+        node = 0
+        for step, (letter, output) in enumerate(trace):
+            letter = self._symbol(self._inputs, letter)
+            output = self._symbol(self._outputs, output)
+            edge = self.transitions[node].get(letter)
+            if edge is None:
+                if self.max_nodes is not None and len(self.transitions) >= self.max_nodes:
+                    # memory bound reached: the rest of the trace is dropped
+                    self.truncated_traces += 1
+                    return
+                edge = self.transitions[node][letter] = (output, len(self.transitions))
+                self.transitions.append({})
+            elif edge[0] != output:
+                raise ValueError(f"non-deterministic output after {step + 1} steps of a trace")
+            node = edge[1]
+
+    def add_traces(self, traces) -> "PrefixTreeAcceptor":
+        for trace in traces:
+            self.add_trace(trace)
+        return self
+
+    @property
+    def inputs(self) -> list:
+        return list(self._inputs)
+
+    @property
+    def outputs(self) -> list:
+        return list(self._outputs)
+
+
+def _try_merge(transitions: list, red_node: int, blue_node: int, parent: int,
+               parent_letter) -> dict | None:
+    # redirects the edge into blue_node to red_node and folds the PTA subtree of blue_node
+    # into red_node, returns the changed transition maps
+    parent_transitions = dict(transitions[parent])
+    parent_transitions[parent_letter] = (parent_transitions[parent_letter][0], red_node)
+    changes = {parent: parent_transitions}
+    stack = [(red_node, blue_node)]
+    while stack:
+        target, source = stack.pop()
+        target_transitions = changes.get(target, transitions[target])
+        for letter, (output, child) in transitions[source].items():
+            edge = target_transitions.get(letter)
+            if edge is None:
+                if target not in changes:
+                    target_transitions = changes[target] = dict(target_transitions)
+                target_transitions[letter] = (output, child)
+            elif edge[0] != output:
+                return None
+            else:
+                stack.append((edge[1], child))
+    return changes
+
+
+def run_mealy_rpni(pta: PrefixTreeAcceptor) -> MealyMachine:
+    transitions = pta.transitions
+    red = [0]
+    # red node -> its access word in the hypothesis
+    access = {0: ()}
+    # blue frontier in shortlex order of the access words in the hypothesis as a heap of
+    # (length, access word, node, red parent), stale entries are skipped on pop. The PTA
+    # depth of a node is no order: a subtree folded into a red node keeps the depths it had
+    # below the blue node
+    blue = []
+
+    def push_children(red_node: int, letters=None):
+        for letter in letters if letters is not None else transitions[red_node]:
+            child = transitions[red_node][letter][1]
+            if child not in access:
+                word = access[red_node] + (letter,)
+                heapq.heappush(blue, (len(word), word, child, red_node))
+
+    push_children(0)
+    while blue:
+        _, word, blue_node, parent = heapq.heappop(blue)
+        if blue_node in access or transitions[parent][word[-1]][1] != blue_node:
+            continue
+        for red_node in red:
+            changes = _try_merge(transitions, red_node, blue_node, parent, word[-1])
+            if changes is not None:
+                for node, node_transitions in changes.items():
+                    added = node_transitions.keys() - transitions[node].keys()
+                    transitions[node] = node_transitions
+                    if node in access:
+                        push_children(node, added)
+                break
+        else:
+            red.append(blue_node)
+            access[blue_node] = word
+            push_children(blue_node)
+
+    inputs, outputs = pta.inputs, pta.outputs
+    states = {node: MealyState(f's{i}') for i, node in enumerate(red)}
+    for node, state in states.items():
+        for letter, (output, child) in transitions[node].items():
+            state.transitions[inputs[letter]] = states[child]
+            state.output_fun[inputs[letter]] = outputs[output]
+    return MealyMachine(states[0], list(states.values()))
+
+
+def learn_from_traces(traces, max_nodes: int | None = None) -> MealyMachine:
+    return run_mealy_rpni(PrefixTreeAcceptor(max_nodes).add_traces(traces))
+
+
+def io_traces_from_log(path, system_name: str, split_on: tuple = ('r',), max_length: int | None = 1000):
+    # one trace per session, cut after every input in split_on as it brings the system
+    # back to its initial state (the HVAC 'r' reset) and wherever the logged state hash shows
+    # the initial state again; records of other systems are skipped.
+    # A trace that reaches max_length is yielded as it is and the rest of its session is
+    # skipped up to the next cut, as the following steps no longer start in the initial state
+    system_id = SYSTEM_IDS[system_name]
+    trace_system = SYSTEMS[system_id]
+    messages = {code: message for message, code in trace_system.result_codes.items()}
+    initial_hash = state_hash(trace_system.system_class())
+    sessions = {}
+    skipped = set()
+    for record in read_trace(path):
+        if record.system != system_id or record.opcode == TICK_OPCODE:
+            continue
+        command = decode_command(record)
+        cut = (command[1] if trace_system.with_pump_id else command[0]) in split_on or \
+            record.state_hash == initial_hash != NO_STATE_HASH
+        if record.session in skipped:
+            if cut:
+                skipped.discard(record.session)
+            continue
+        letter = " ".join(str(part) for part in command if part is not None)
+        trace = sessions.setdefault(record.session, [])
+        trace.append((letter, messages.get(record.result, "?")))
+        if cut or (max_length is not None and len(trace) >= max_length):
+            yield trace
+            sessions[record.session] = []
+            if not cut:
+                skipped.add(record.session)
+    for trace in sessions.values():
+        if trace:
+            yield trace
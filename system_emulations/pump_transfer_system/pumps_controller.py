@@ -1,107 +1,306 @@
 from typing import Union
 
+import numpy as np
+
+from system_emulations.batch import BatchResult
+from system_emulations.instrumentation import instrumented_handler, timed
+
+DEFAULT_SYNC_GROUP = "sync"
+# group slots are stored as uint8, slot 0 stands for pumps in async mode
+MAX_SYNC_GROUPS = 255
+
 
 class Pump:
-    def __init__(self):
-        self.status: bool = False
-        self.current_volume: int = 0
-        self.flow_speed: int = 0
+    __slots__ = ('status', 'current_volume', 'flow_speed')
+
+    def __init__(self, status: bool = False, current_volume: int = 0, flow_speed: int = 0):
+        self.status: bool = status
+        self.current_volume: int = current_volume
+        self.flow_speed: int = flow_speed
+
+    def to_tuple(self) -> tuple:
+        return self.status, self.current_volume, self.flow_speed
+
+    def __eq__(self, other):
+        if not isinstance(other, Pump):
+            return NotImplemented
+        return self.to_tuple() == other.to_tuple()
+
+    def __hash__(self):
+        return hash(self.to_tuple())
 
 
 class PumpsController:
-    def __init__(self):
-        self._pumps = self.basic_pump_initialization()
-        self.synced_pumps_id = set()
+    def __init__(self, pumps_num: int = 4):
+        self._status, self._current_volume, self._flow_speed = \
+            self.basic_pump_initialization(pumps_num)
+        self._ids = np.arange(pumps_num)
+        # per pump the slot of its sync group, slot i + 1 is _group_names[i]
+        self._sync_group = np.zeros(pumps_num, dtype=np.uint8)
+        self._group_names = [DEFAULT_SYNC_GROUP]
+        # per slot the number of members and of members at volume 0 and 100
+        self._group_size = np.zeros(2, dtype=np.int64)
+        self._group_empty = np.zeros(2, dtype=np.int64)
+        self._group_full = np.zeros(2, dtype=np.int64)
+        self._recount_groups()
 
     @staticmethod
-    def basic_pump_initialization(pumps_num: int = 4) -> list:
-        return [Pump() for _ in range(pumps_num)]
+    def basic_pump_initialization(pumps_num: int = 4) -> tuple:
+        return (np.zeros(pumps_num, dtype=bool),
+                np.zeros(pumps_num, dtype=np.int64),
+                np.zeros(pumps_num, dtype=np.int64))
+
+    @property
+    def synced_pumps_id(self) -> set:
+        return set(self.get_sync_pumps_ids())
+
+    def snapshot(self) -> tuple:
+        # with only the default group the fourth field is the former boolean sync mask,
+        # the last one names the slots it refers to
+        return (self._status.tobytes(), self._current_volume.tobytes(),
+                self._flow_speed.tobytes(), self._sync_group.tobytes(), tuple(self._group_names))
 
+    def restore(self, state: tuple) -> None:
+        status, current_volume, flow_speed, sync_group, *group_names = state
+        # snapshots without group names only know the default group
+        group_names = list(group_names[0]) if group_names else [DEFAULT_SYNC_GROUP]
+        sync_group = np.frombuffer(sync_group, dtype=np.uint8)
+        if len(group_names) > MAX_SYNC_GROUPS or sync_group.max(initial=0) > len(group_names):
+            raise ValueError("snapshot refers to unknown sync groups")
+        if group_names != self._group_names:
+            self._group_names = group_names
+            self._group_size = np.zeros(len(group_names) + 1, dtype=np.int64)
+            self._group_empty = np.zeros(len(group_names) + 1, dtype=np.int64)
+            self._group_full = np.zeros(len(group_names) + 1, dtype=np.int64)
+        self._status[:] = np.frombuffer(status, dtype=bool)
+        self._current_volume[:] = np.frombuffer(current_volume, dtype=np.int64)
+        self._flow_speed[:] = np.frombuffer(flow_speed, dtype=np.int64)
+        self._sync_group[:] = sync_group
+        self._recount_groups()
+
+    def _recount_groups(self) -> None:
+        slots = len(self._group_size)
+        volume = self._current_volume
+        self._group_size[:] = np.bincount(self._sync_group, minlength=slots)
+        self._group_empty[:] = np.bincount(self._sync_group, weights=volume == 0, minlength=slots)
+        self._group_full[:] = np.bincount(self._sync_group, weights=volume == 100, minlength=slots)
+
+    def _count_volumes(self, pumps: np.ndarray, sign: int) -> None:
+        # removes (-1) or adds (1) the volumes of pumps to the counters of their groups
+        groups = self._sync_group[pumps]
+        volume = self._current_volume[pumps]
+        np.add.at(self._group_empty, groups, sign * (volume == 0))
+        np.add.at(self._group_full, groups, sign * (volume == 100))
+
+    def _set_sync_group(self, pump_id: int, slot: int) -> None:
+        slot = int(slot)
+        self._count_volumes(pump_id, -1)
+        self._group_size[self._sync_group[pump_id]] -= 1
+        self._sync_group[pump_id] = slot
+        self._group_size[slot] += 1
+        self._count_volumes(pump_id, 1)
+
+    def _ready_groups(self) -> np.ndarray:
+        # per slot whether all members are empty or all are filled up, async never is
+        size = self._group_size
+        ready = (size > 0) & ((self._group_empty == size) | (self._group_full == size))
+        ready[0] = False
+        return ready
+
+    @timed("pumps.update")
     def update(self):
-        if len(self.get_sync_pumps_ids()) != 0 and \
-                (self._all_sync_pumps_empty() or self._all_sync_pumps_filled_up()):
-            for _id in self.get_sync_pumps_ids():
-                self.set_pump_status(_id, True)
+        sync_group = self._sync_group
+        ready = self._ready_groups()
+        if ready.any():
+            self._status[ready[sync_group]] = True
 
-        for i in range(len(self._pumps)):
-            if self._get_pump_status(i) == 0:
+        active = self._status.copy()
+        if not active.any():
+            return
+        val = np.clip(self._current_volume + self._flow_speed, 0, 100)
+        emptied = active & (val == 0)
+        filled_up = active & (val == 100)
+
+        synced = sync_group > 0
+        sync_emptied = emptied & synced
+        group_stop = sync_emptied.any()
+        if group_stop:
+            # pumps of a group that come after its first emptied one
+            # are switched off before their turn
+            first = np.full(len(ready), len(active))
+            np.minimum.at(first, sync_group[sync_emptied], self._ids[sync_emptied])
+            stopped = synced & (first[sync_group] < len(active))
+            active &= ~(synced & (self._ids > first[sync_group]))
+            emptied &= active
+            filled_up &= active
+
+        moved = np.flatnonzero(active)
+        self._count_volumes(moved, -1)
+        self._current_volume[moved] = val[moved]
+        self._count_volumes(moved, 1)
+        self._flow_speed[emptied] = -self._flow_speed[emptied]
+        self._flow_speed[filled_up] = np.abs(self._flow_speed[filled_up])
+        self._status[filled_up & synced] = False
+        if group_stop:
+            self._status[stopped] = False
+
+    def run(self, n_ticks: int, trace: bool = False) -> list | None:
+        events = [] if trace else None
+        tick = 0
+        while tick < n_ticks:
+            quiet, moving = self._quiet_ticks()
+            if quiet:
+                skip = min(quiet, n_ticks - tick)
+                moving = np.flatnonzero(moving)
+                self._count_volumes(moving, -1)
+                self._current_volume[moving] += skip * self._flow_speed[moving]
+                self._count_volumes(moving, 1)
+                tick += skip
                 continue
-            val = self._get_pump_current_volume(i)
-            val = 100 if val + self._pumps[i].flow_speed > 100 \
-                else 0 if val + self._pumps[i].flow_speed < 0 \
-                else val + self._pumps[i].flow_speed
-            self._set_pump_current_volume(i, val)
-            if val == 100:
-                self.set_pump_flow_speed(i, abs(self._pumps[i].flow_speed))
-                if i in self.get_sync_pumps_ids():
-                    self.set_pump_status(i, False)
-            elif val == 0:
-                self.set_pump_flow_speed(i, -self._pumps[i].flow_speed)
-                if i in self.get_sync_pumps_ids():
-                    for _id in self.get_sync_pumps_ids():
-                        self.set_pump_status(_id, False)
-
-    def _all_sync_pumps_filled_up(self) -> bool:
-        for _id in self.synced_pumps_id:
-            if self._get_pump_current_volume(_id) != 100:
-                return False
-        return True
-
-    def _all_sync_pumps_empty(self) -> bool:
-        for _id in self.synced_pumps_id:
-            if self._get_pump_current_volume(_id) != 0:
-                return False
-        return True
+
+            status = self._status.copy()
+            volume = self._current_volume.copy()
+            flow_speed = self._flow_speed.copy()
+            self.update()
+            tick += 1
+            changed = (status != self._status) | (flow_speed != self._flow_speed)
+            if not changed.any() and (volume == self._current_volume).all():
+                # the state is a fixed point of update()
+                break
+            if trace:
+                changed |= (volume != self._current_volume) & \
+                    ((self._current_volume == 0) | (self._current_volume == 100))
+                events.append((tick, np.flatnonzero(changed).tolist()))
+        return events
+
+    def _quiet_ticks(self) -> tuple:
+        ready = self._ready_groups()
+        if ready.any() and not self._status[ready[self._sync_group]].all():
+            # the next update switches a group on
+            return 0, None
+
+        volume = self._current_volume
+        flow_speed = self._flow_speed
+        stationary = (self._sync_group == 0) & (((volume == 100) & (flow_speed >= 0)) |
+                              ((volume == 0) & (flow_speed == 0)))
+        moving = self._status & ~stationary
+        if not moving.any():
+            return np.inf, moving
+
+        volume = volume[moving]
+        flow_speed = flow_speed[moving]
+        distance = np.where(flow_speed > 0, 100 - volume, volume)
+        speed = np.abs(flow_speed)
+        ticks_to_edge = np.where(
+            speed > 0, -(-distance // np.maximum(speed, 1)),
+            np.where((volume == 0) | (volume == 100), 1, np.inf))
+        ticks_to_edge = np.min(ticks_to_edge)
+        if ticks_to_edge == np.inf:
+            return np.inf, moving
+        return int(max(ticks_to_edge, 1)) - 1, moving
+
+    def _all_sync_pumps_filled_up(self, group: str = DEFAULT_SYNC_GROUP) -> bool:
+        slot = self._group_slot(group)
+        return bool(self._group_full[slot] == self._group_size[slot])
+
+    def _all_sync_pumps_empty(self, group: str = DEFAULT_SYNC_GROUP) -> bool:
+        slot = self._group_slot(group)
+        return bool(self._group_empty[slot] == self._group_size[slot])
+
+    def _group_slot(self, group: str) -> int:
+        if group not in self._group_names:
+            raise ValueError(f'unknown sync group "{group}"')
+        return self._group_names.index(group) + 1
+
+    def add_sync_group(self, group: str) -> None:
+        if group in self._group_names:
+            return
+        if len(self._group_names) == MAX_SYNC_GROUPS:
+            raise ValueError(f"at most {MAX_SYNC_GROUPS} sync groups are supported")
+        self._group_names.append(group)
+        self._group_size = np.append(self._group_size, 0)
+        self._group_empty = np.append(self._group_empty, 0)
+        self._group_full = np.append(self._group_full, 0)
+
+    def get_sync_groups(self) -> dict:
+        return {group: np.flatnonzero(self._sync_group == slot).tolist()
+                for slot, group in enumerate(self._group_names, 1)}
+
+    def set_pump_sync_group(self, pump_id: int, group: str | None) -> None:
+        # None switches the pump to async mode, unknown groups are created
+        if group is None:
+            self._set_sync_group(pump_id, 0)
+            return
+        self.add_sync_group(group)
+        self._set_sync_group(pump_id, self._group_slot(group))
 
     def _get_pump_status(self, pump_id: int) -> bool:
-        return self._pumps[pump_id].status
+        return bool(self._status[pump_id])
 
     def _get_pump_current_volume(self, pump_id: int) -> int:
-        return self._pumps[pump_id].current_volume
+        return int(self._current_volume[pump_id])
 
     def _set_pump_current_volume(self, pump_id: int, volume: int) -> None:
         if not isinstance(volume, int):
             raise ValueError("current volume must be an integer")
         if not 0 <= volume <= 100:
             raise ValueError("current volume must be in the range from 0 to 100")
-        self._pumps[pump_id].current_volume = volume
+        self._count_volumes(pump_id, -1)
+        self._current_volume[pump_id] = volume
+        self._count_volumes(pump_id, 1)
 
     def set_pump_flow_speed(self, pump_id: int, flow_speed: int) -> None:
         if not -100 <= flow_speed <= 100 or not isinstance(flow_speed, int):
             raise ValueError(
                 "flow speed must be an integer in the range from -100 to 100")
-        self._pumps[pump_id].flow_speed = flow_speed
+        self._flow_speed[pump_id] = flow_speed
 
     def set_pump_status(self, pump_id: int, value: bool) -> None:
         if not isinstance(value, bool):
             raise ValueError('status must be a boolean')
-        self._pumps[pump_id].status = value
+        self._status[pump_id] = value
 
     def set_pump_operating_mode(self, pump_id: int, mode: str) -> None:
         if mode not in ["async", "sync"]:
             raise ValueError('operating mode must be either "async" or "sync"')
-        if mode == 'sync':
-            self.synced_pumps_id.add(pump_id)
-        elif pump_id in self.get_sync_pumps_ids():
-            self.synced_pumps_id.remove(pump_id)
+        self.set_pump_sync_group(pump_id, DEFAULT_SYNC_GROUP if mode == 'sync' else None)
 
-    def get_sync_pumps_ids(self) -> list:
-        return list(self.synced_pumps_id)
+    def get_pump(self, pump_id: int) -> Pump:
+        return Pump(bool(self._status[pump_id]), int(self._current_volume[pump_id]),
+                    int(self._flow_speed[pump_id]))
+
+    def get_sync_pumps_ids(self, group: str | None = None) -> list:
+        # pumps of any group if no group is given
+        if group is None:
+            return np.flatnonzero(self._sync_group).tolist()
+        return np.flatnonzero(self._sync_group == self._group_slot(group)).tolist()
 
     def get_pumps_count(self) -> int:
-        return len(self._pumps)
+        return len(self._status)
 
     def get_pumps_ids(self) -> list:
-        return [self._pumps.index(pump) for pump in self._pumps]
+        return list(range(self.get_pumps_count()))
 
     def get_pumps_info(self):
-        return [{str(self._pumps.index(pump)): {"pump_status": pump.status,
-                           "pump_flow_speed": pump.flow_speed,
-                           "pump_current_volume": pump.current_volume}} for pump in self._pumps.copy()]
+        return [{str(i): {"pump_status": status,
+                          "pump_flow_speed": flow_speed,
+                          "pump_current_volume": current_volume}}
+                for i, (status, flow_speed, current_volume) in enumerate(zip(
+                    self._status.tolist(), self._flow_speed.tolist(),
+                    self._current_volume.tolist()))]
+
+
+PUMPS_SUCCESS_MESSAGES = {"Operating mode successfully changed",
+                          "Flow speed successfully changed",
+                          "Pump status successfully changed"}
+
+
+PUMPS_OPCODES = {"-m": 0, "-f": 1, "-s": 2}
 
 
+@instrumented_handler("pumps", 2, "cmd", PUMPS_OPCODES, lambda result: result not in PUMPS_SUCCESS_MESSAGES)
 def pumps_system_command_handler(system: PumpsController, _id: int, cmd: str, value: Union[str, int, bool]):
-    if _id not in system.get_pumps_ids():
+    if _id not in range(system.get_pumps_count()):
         return "Invalid pump id"
     try:
         match cmd:
@@ -120,6 +319,56 @@ def pumps_system_command_handler(system: PumpsController, _id: int, cmd: str, va
         return e.args[0]
 
 
+PUMPS_MESSAGES = ("Operating mode successfully changed",
+                  "Flow speed successfully changed",
+                  "Pump status successfully changed",
+                  'operating mode must be either "async" or "sync"',
+                  "flow speed must be an integer in the range from -100 to 100",
+                  "status must be a boolean",
+                  "Invalid pump id",
+                  "Unknown command")
+MODE_OK, FLOW_OK, STATUS_OK, MODE_ERR, FLOW_ERR, STATUS_ERR, INVALID_ID, UNKNOWN_CMD = range(8)
+
+
+def pumps_system_batch_handler(system: PumpsController, ids, opcodes, values,
+                               update: bool = False) -> BatchResult:
+    # -m values: 0 - async, 1 - sync; -s values: 0 - off, 1 - on
+    ids, opcodes, values = (
+        seq.tolist() if isinstance(seq, np.ndarray) else seq for seq in (ids, opcodes, values))
+    pumps_count = system.get_pumps_count()
+    status, flow_speed = system._status, system._flow_speed
+    codes = np.empty(len(opcodes), dtype=np.int8)
+    for i, (_id, opcode, value) in enumerate(zip(ids, opcodes, values)):
+        # ids and values are checked like set_pump_flow_speed checks its value: floats are
+        # no ints, also when they are integral, and float arrays must not be truncated into ints
+        if not isinstance(_id, int) or not 0 <= _id < pumps_count:
+            codes[i] = INVALID_ID
+        elif opcode == 0:
+            if isinstance(value, int) and value in (0, 1):
+                # slot 1 is the default sync group
+                system._set_sync_group(_id, value)
+                codes[i] = MODE_OK
+            else:
+                codes[i] = MODE_ERR
+        elif opcode == 1:
+            if isinstance(value, int) and -100 <= value <= 100:
+                flow_speed[_id] = value
+                codes[i] = FLOW_OK
+            else:
+                codes[i] = FLOW_ERR
+        elif opcode == 2:
+            if isinstance(value, int) and value in (0, 1):
+                status[_id] = value
+                codes[i] = STATUS_OK
+            else:
+                codes[i] = STATUS_ERR
+        else:
+            codes[i] = UNKNOWN_CMD
+        if update:
+            system.update()
+    return BatchResult(codes, PUMPS_MESSAGES)
+
+
 if __name__ == "__main__":
     pumps_system = PumpsController()
     print(f"pumps_id = {pumps_system.get_pumps_ids()}")
@@ -0,0 +1,81 @@
+from random import Random
+
+
+class PumpsMapper:
+    valid_flow_speed = (1, 100)
+    invalid_flow_speed = (101, 1000)
+    representative_id = 0
+    representative_valid = 50
+    representative_invalid = 500
+
+    symbols = {
+        "Operating mode successfully changed": "MODE_OK",
+        "Flow speed successfully changed": "FLOW_OK",
+        "Pump status successfully changed": "STATUS_OK",
+        "flow speed must be an integer in the range from -100 to 100": "FLOW_ERR",
+        'operating mode must be either "async" or "sync"': "MODE_ERR",
+        "status must be a boolean": "STATUS_ERR",
+        "Invalid pump id": "ID_ERR",
+        "Unknown command": "UNKNOWN",
+    }
+
+    def __init__(self, seed: int | None = 0, pumps_num: int = 4):
+        self.seed = seed
+        self.pumps_num = pumps_num
+        self._rng = Random(seed)
+
+    def reset(self) -> None:
+        # every word starts from the same RNG state, so equal words are
+        # always mapped to equal concrete commands
+        self._rng.seed(self.seed)
+
+    def get_state(self) -> tuple | None:
+        # without a seed no values are drawn, so the mapper has no state
+        if self.seed is None:
+            return None
+        return self._rng.getstate()
+
+    def set_state(self, state: tuple | None) -> None:
+        if state is not None:
+            self._rng.setstate(state)
+
+    def _pump_id(self) -> int:
+        if self.seed is None:
+            return self.representative_id
+        return self._rng.randrange(self.pumps_num)
+
+    def _valid(self) -> int:
+        if self.seed is None:
+            return self.representative_valid
+        return self._rng.randint(*self.valid_flow_speed)
+
+    def _invalid(self) -> int:
+        if self.seed is None:
+            return self.representative_invalid
+        return self._rng.randint(*self.invalid_flow_speed)
+
+    def concretize(self, letter: str) -> tuple | None:
+        match letter:
+            case "change flow speed from 1 to 100":
+                return self._pump_id(), '-f', self._valid()
+            case "change flow speed from -100 to -1":
+                return self._pump_id(), '-f', -self._valid()
+            case "change flow speed from 101 to inf":
+                return self._pump_id(), '-f', self._invalid()
+            case "change flow speed from -inf to -101":
+                return self._pump_id(), '-f', -self._invalid()
+            case "change flow speed zero":
+                return self._pump_id(), '-f', 0
+            case "change mode sync":
+                return self._pump_id(), '-m', 'sync'
+            case "change mode async":
+                return self._pump_id(), '-m', 'async'
+            case "turn on":
+                return self._pump_id(), '-s', True
+            case "turn off":
+                return self._pump_id(), '-s', False
+            case _:
+                return None
+
+    def abstract(self, output: str) -> str:
+        return self.symbols.get(output, "ERR")
@@ -0,0 +1,154 @@
+import random
+
+from system_emulations.pump_transfer_system.pumps_controller import PumpsController, \
+    pumps_system_command_handler, DEFAULT_SYNC_GROUP
+
+
+class ReferencePumps:
+    # the per-pump update rules of the original list based controller, with its single
+    # sync set generalized to one set per sync group
+    def __init__(self, pumps_num: int):
+        self.status = [False] * pumps_num
+        self.current_volume = [0] * pumps_num
+        self.flow_speed = [0] * pumps_num
+        # pump id -> sync group, async pumps are not in it
+        self.groups = {}
+
+    def members(self, group: str) -> list:
+        return sorted(_id for _id, member_group in self.groups.items() if member_group == group)
+
+    def all_empty(self, group: str) -> bool:
+        return all(self.current_volume[_id] == 0 for _id in self.members(group))
+
+    def all_filled_up(self, group: str) -> bool:
+        return all(self.current_volume[_id] == 100 for _id in self.members(group))
+
+    def command(self, _id, cmd: str, value) -> str:
+        if _id not in range(len(self.status)):
+            return "Invalid pump id"
+        try:
+            match cmd:
+                case '-m':
+                    if value not in ["async", "sync"]:
+                        raise ValueError('operating mode must be either "async" or "sync"')
+                    self.set_group(_id, DEFAULT_SYNC_GROUP if value == 'sync' else None)
+                    return "Operating mode successfully changed"
+                case '-f':
+                    if not -100 <= value <= 100 or not isinstance(value, int):
+                        raise ValueError("flow speed must be an integer in the range from -100 to 100")
+                    self.flow_speed[_id] = value
+                    return "Flow speed successfully changed"
+                case '-s':
+                    if not isinstance(value, bool):
+                        raise ValueError("status must be a boolean")
+                    self.status[_id] = value
+                    return "Pump status successfully changed"
+                case _:
+                    return "Unknown command"
+        except Exception as e:
+            return e.args[0]
+
+    def set_group(self, _id: int, group: str | None) -> None:
+        if group is None:
+            self.groups.pop(_id, None)
+        else:
+            self.groups[_id] = group
+
+    def update(self) -> None:
+        for group in set(self.groups.values()):
+            if self.all_empty(group) or self.all_filled_up(group):
+                for _id in self.members(group):
+                    self.status[_id] = True
+
+        for i in range(len(self.status)):
+            if not self.status[i]:
+                continue
+            val = self.current_volume[i] + self.flow_speed[i]
+            val = 100 if val > 100 else 0 if val < 0 else val
+            self.current_volume[i] = val
+            if val == 100:
+                self.flow_speed[i] = abs(self.flow_speed[i])
+                if i in self.groups:
+                    self.status[i] = False
+            elif val == 0:
+                self.flow_speed[i] = -self.flow_speed[i]
+                if i in self.groups:
+                    for _id in self.members(self.groups[i]):
+                        self.status[_id] = False
+
+    def get_pumps_info(self) -> list:
+        return [{str(i): {"pump_status": status, "pump_flow_speed": flow_speed, "pump_current_volume": volume}}
+                for i, (status, flow_speed, volume) in enumerate(zip(self.status, self.flow_speed,
+                                                                     self.current_volume))]
+
+
+def random_command(rng: random.Random, pumps_num: int) -> tuple:
+    values = ['sync', 'async', 'other', True, False, 0, 7.9, 101, -101,
+              rng.randint(-100, 100), rng.choice((-100, -50, -25, 25, 50, 100))]
+    return rng.randint(-1, pumps_num), rng.choice(['-m', '-f', '-s', '-x']), rng.choice(values)
+
+
+def check_same(controller: PumpsController, reference: ReferencePumps, groups: list) -> None:
+    assert controller.get_pumps_info() == reference.get_pumps_info(), \
+        (controller.get_pumps_info(), reference.get_pumps_info())
+    assert controller.get_sync_pumps_ids() == sorted(reference.groups)
+    for group in groups:
+        if group in controller.get_sync_groups():
+            assert controller.get_sync_pumps_ids(group) == reference.members(group)
+            # the maintained per-group counters
+            assert controller._all_sync_pumps_empty(group) == reference.all_empty(group)
+            assert controller._all_sync_pumps_filled_up(group) == reference.all_filled_up(group)
+
+
+def compare_update(runs: int, steps: int, groups: list, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    for _ in range(runs):
+        pumps_num = rng.randint(1, 8)
+        controller, reference = PumpsController(pumps_num), ReferencePumps(pumps_num)
+        for _ in range(steps):
+            if len(groups) > 1 and rng.random() < 0.1:
+                _id, group = rng.randrange(pumps_num), rng.choice(groups + [None])
+                controller.set_pump_sync_group(_id, group)
+                reference.set_group(_id, group)
+            else:
+                command = random_command(rng, pumps_num)
+                assert pumps_system_command_handler(controller, *command) == reference.command(*command), command
+            for _ in range(rng.randint(0, 3)):
+                controller.update()
+                reference.update()
+            check_same(controller, reference, groups)
+
+
+def compare_run(runs: int, groups: list, seed: int = 0) -> None:
+    # run(n) fast-forwards quiet stretches, it must end where n single updates end
+    rng = random.Random(seed)
+    for _ in range(runs):
+        pumps_num = rng.randint(1, 8)
+        controller = PumpsController(pumps_num)
+        for _ in range(rng.randint(0, 20)):
+            pumps_system_command_handler(controller, *random_command(rng, pumps_num))
+            if rng.random() < 0.3:
+                controller.set_pump_sync_group(rng.randrange(pumps_num), rng.choice(groups + [None]))
+            controller.update()
+        stepped = PumpsController(pumps_num)
+        stepped.restore(controller.snapshot())
+        n_ticks = rng.randint(0, 400)
+        for _ in range(n_ticks):
+            stepped.update()
+        controller.run(n_ticks)
+        assert controller.snapshot() == stepped.snapshot(), n_ticks
+        assert controller.get_pumps_info() == stepped.get_pumps_info()
+
+
+def main():
+    compare_update(runs=500, steps=60, groups=[DEFAULT_SYNC_GROUP])
+    print("update() matches the original rules with the default sync group")
+    compare_update(runs=500, steps=60, groups=[DEFAULT_SYNC_GROUP, "a", "b"], seed=1)
+    print("update() matches the per-group rules with several sync groups")
+    compare_run(runs=500, groups=[DEFAULT_SYNC_GROUP], seed=2)
+    compare_run(runs=500, groups=[DEFAULT_SYNC_GROUP, "a", "b"], seed=3)
+    print("run() matches repeated update()")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import math
+import time
+from collections import deque
+
+from system_emulations.pump_transfer_system.pumps_controller import PumpsController, pumps_system_command_handler
+
+
+class TickStats:
+    def __init__(self):
+        self.ticks = 0
+        self.wakeups = 0
+        self.overruns = 0
+        self.dropped_ticks = 0
+        self.max_lag = 0.0
+        self._lag_sum = 0.0
+        self._lag_square_sum = 0.0
+        self._last_lag = None
+        self._lag_change_sum = 0.0
+
+    def record(self, lag: float, ticks: int, dropped: int = 0) -> None:
+        self.wakeups += 1
+        self.ticks += ticks
+        self.overruns += ticks > 1 or dropped > 0
+        self.dropped_ticks += dropped
+        self.max_lag = max(self.max_lag, lag)
+        self._lag_sum += lag
+        self._lag_square_sum += lag * lag
+        if self._last_lag is not None:
+            self._lag_change_sum += abs(lag - self._last_lag)
+        self._last_lag = lag
+
+    @property
+    def mean_lag(self) -> float:
+        return self._lag_sum / self.wakeups if self.wakeups else 0.0
+
+    @property
+    def lag_stdev(self) -> float:
+        if not self.wakeups:
+            return 0.0
+        mean = self.mean_lag
+        return math.sqrt(max(self._lag_square_sum / self.wakeups - mean * mean, 0.0))
+
+    @property
+    def jitter(self) -> float:
+        # mean absolute change of the lag from one wakeup to the next, a constant lag has none
+        return self._lag_change_sum / (self.wakeups - 1) if self.wakeups > 1 else 0.0
+
+    def to_dict(self):
+        return {
+            'ticks': self.ticks,
+            'wakeups': self.wakeups,
+            'overruns': self.overruns,
+            'dropped_ticks': self.dropped_ticks,
+            'max_lag': self.max_lag,
+            'mean_lag': self.mean_lag,
+            'lag_stdev': self.lag_stdev,
+            'jitter': self.jitter,
+        }
+
+
+class PumpsTickScheduler:
+    def __init__(self, rate_hz: float = 100.0, lazy: bool = True, max_catch_up: int | None = None,
+                 on_result=None, clock=time.perf_counter, sleep=time.sleep):
+        self.period = 1 / rate_hz
+        # lazy: a controller is only advanced when a command arrives or it is read,
+        # run() then fast-forwards all the ticks it owes at once.
+        # Eager mode updates every controller on every tick, one update() each (about 17 us),
+        # so it only keeps up while controllers * 17 us stays below the period: roughly 500
+        # controllers at 100 Hz, beyond that ticks overrun. It is meant for small setups that
+        # need each tick applied on time, larger ones should stay lazy.
+        self.lazy = lazy
+        self.max_catch_up = max_catch_up
+        self.on_result = on_result
+        self.clock = clock
+        self.sleep = sleep
+        self.controllers = []
+        self.tick_count = 0
+        self.stats = TickStats()
+        self._applied_ticks = []
+        self._queues = []
+        self._pending = set()
+
+    def add(self, controller: PumpsController | None = None) -> int:
+        self.controllers.append(controller if controller is not None else PumpsController())
+        self._applied_ticks.append(self.tick_count)
+        self._queues.append(deque())
+        return len(self.controllers) - 1
+
+    def submit(self, index: int, _id: int, cmd: str, value) -> None:
+        self._queues[index].append((_id, cmd, value))
+        self._pending.add(index)
+
+    def controller(self, index: int) -> PumpsController:
+        self._advance(index)
+        return self.controllers[index]
+
+    def _advance(self, index: int) -> None:
+        owed = self.tick_count - self._applied_ticks[index]
+        if owed:
+            self.controllers[index].run(owed)
+            self._applied_ticks[index] = self.tick_count
+
+    def _apply_commands(self) -> None:
+        for index in self._pending:
+            self._advance(index)
+            controller = self.controllers[index]
+            queue = self._queues[index]
+            while queue:
+                command = queue.popleft()
+                result = pumps_system_command_handler(controller, *command)
+                if self.on_result is not None:
+                    self.on_result(index, command, result)
+        self._pending.clear()
+
+    def advance(self, n_ticks: int = 1) -> None:
+        # queued commands are applied on the boundary before the next tick
+        self._apply_commands()
+        self.tick_count += n_ticks
+        if not self.lazy:
+            for index in range(len(self.controllers)):
+                self._advance(index)
+
+    def sync(self) -> None:
+        for index in range(len(self.controllers)):
+            self._advance(index)
+
+    def run_for(self, duration: float) -> TickStats:
+        start = self.clock()
+        end = start + duration
+        deadline = start + self.period
+        while deadline <= end:
+            now = self.clock()
+            if now < deadline:
+                self.sleep(deadline - now)
+                now = self.clock()
+            lag = now - deadline
+            due = 1 + int(lag // self.period)
+            dropped = 0
+            if self.max_catch_up is not None and due > self.max_catch_up:
+                dropped = due - self.max_catch_up
+                due = self.max_catch_up
+            self.stats.record(lag, due, dropped)
+            self.advance(due)
+            deadline += (due + dropped) * self.period
+        return self.stats
@@ -0,0 +1,178 @@
+import gzip
+import hashlib
+import json
+from pathlib import Path
+
+from aalpy.base import SUL
+
+CACHE_VERSION = 1
+# letters and outputs are stored as JSON: no code is run to read a cache file
+SYMBOL_TYPES = (str, int, float, bool, type(None))
+
+
+def _encode_symbol(symbol):
+    # tuples become JSON arrays and are read back as tuples, they are the only sequences a letter can be
+    if isinstance(symbol, tuple):
+        return [_encode_symbol(item) for item in symbol]
+    if isinstance(symbol, SYMBOL_TYPES):
+        return symbol
+    raise TypeError(f"{type(symbol).__name__} values cannot be stored in a query cache")
+
+
+def _decode_symbol(symbol):
+    if isinstance(symbol, list):
+        return tuple(_decode_symbol(item) for item in symbol)
+    return symbol
+
+
+def sul_fingerprint(sul: SUL) -> str:
+    # SULs that know their system and configuration describe themselves, others only by their class
+    if hasattr(sul, "fingerprint"):
+        return sul.fingerprint()
+    cls = type(sul)
+    return hashlib.blake2b(f"{cls.__module__}.{cls.__qualname__}".encode(), digest_size=16).hexdigest()
+
+
+class QueryTrie:
+    def __init__(self):
+        # node: {letter: [output, child node]}
+        self.root = {}
+        # the SUL the answers came from, see sul_fingerprint
+        self.fingerprint = None
+
+    def lookup(self, word) -> list | None:
+        node = self.root
+        outputs = []
+        for letter in word:
+            edge = node.get(letter)
+            if edge is None:
+                return None
+            outputs.append(edge[0])
+            node = edge[1]
+        return outputs
+
+    def insert(self, word, outputs) -> None:
+        node = self.root
+        for letter, output in zip(word, outputs):
+            node = self.add_step(node, letter, output)
+
+    @staticmethod
+    def add_step(node: dict, letter, output) -> dict:
+        edge = node.get(letter)
+        if edge is None:
+            edge = node[letter] = [output, {}]
+        else:
+            edge[0] = output
+        return edge[1]
+
+    def __len__(self):
+        count = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            count += len(node)
+            stack.extend(edge[1] for edge in node.values())
+        return count
+
+    def save(self, path) -> None:
+        # symbols are told apart by their JSON text: 1, 1.0 and True are equal keys of a dict
+        symbols = {}
+        encoded_symbols = []
+
+        def symbol_index(symbol) -> int:
+            encoded = _encode_symbol(symbol)
+            index = symbols.setdefault(json.dumps(encoded), len(symbols))
+            if index == len(encoded_symbols):
+                encoded_symbols.append(encoded)
+            return index
+
+        edges = []
+        stack = [(self.root, -1)]
+        while stack:
+            node, parent = stack.pop()
+            for letter, (output, child) in node.items():
+                edges.append((parent, symbol_index(letter), symbol_index(output)))
+                stack.append((child, len(edges) - 1))
+        data = {"version": CACHE_VERSION, "fingerprint": self.fingerprint, "symbols": encoded_symbols,
+                "edges": [field for edge in edges for field in edge]}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path) -> "QueryTrie":
+        trie = cls()
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            # not a cache file, or one pickled by an earlier version: start over
+            return trie
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            return trie
+        trie.fingerprint = data["fingerprint"]
+        symbols = [_decode_symbol(symbol) for symbol in data["symbols"]]
+        edges = data["edges"]
+        nodes = []
+        for i in range(0, len(edges), 3):
+            parent, letter, output = edges[i:i + 3]
+            node = trie.root if parent == -1 else nodes[parent]
+            nodes.append(cls.add_step(node, symbols[letter], symbols[output]))
+        return trie
+
+
+class CachingSUL(SUL):
+    def __init__(self, sul: SUL, cache: QueryTrie | None = None):
+        super().__init__()
+        self.sul = sul
+        self.cache = cache if cache is not None else QueryTrie()
+        self._node = self.cache.root
+        self._prefix = []
+        self._live = False
+
+    @classmethod
+    def from_file(cls, sul: SUL, path) -> "CachingSUL":
+        fingerprint = sul_fingerprint(sul)
+        cache = QueryTrie.load(path) if Path(path).exists() else None
+        if cache is None or cache.fingerprint != fingerprint:
+            # answers of another system, configuration or version of the code
+            cache = QueryTrie()
+            cache.fingerprint = fingerprint
+        return cls(sul, cache)
+
+    def save(self, path) -> None:
+        if self.cache.fingerprint is None:
+            self.cache.fingerprint = sul_fingerprint(self.sul)
+        self.cache.save(path)
+
+    def query(self, word: tuple) -> list:
+        # the empty word is answered by step(None), as in SUL.query
+        outputs = self.cache.lookup(word if len(word) else (None,))
+        if outputs is not None:
+            self.num_cached_queries += 1
+            return outputs
+        return super().query(word)
+
+    def pre(self):
+        self._node = self.cache.root
+        self._prefix = []
+        self._live = False
+
+    def post(self):
+        if self._live:
+            self.sul.post()
+
+    def step(self, letter):
+        if not self._live:
+            edge = self._node.get(letter)
+            if edge is not None:
+                self._prefix.append(letter)
+                self._node = edge[1]
+                return edge[0]
+            # leave the cache: bring the system to the cached prefix
+            self._live = True
+            self.sul.pre()
+            for cached_letter in self._prefix:
+                self.sul.step(cached_letter)
+        output = self.sul.step(letter)
+        self._node = QueryTrie.add_step(self._node, letter, output)
+        return output
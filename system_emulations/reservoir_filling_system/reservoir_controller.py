@@ -1,4 +1,12 @@
+import numpy as np
+
+from system_emulations.batch import BatchResult
+from system_emulations.instrumentation import instrumented_handler
+
+
 class Reservoir:
+    __slots__ = ('_volume', '_filled_in')
+
     def __init__(self, volume: int = 100, filled_in: bool = False):
         self._volume = volume
         self._filled_in = filled_in
@@ -15,40 +23,102 @@ class Reservoir:
     def filled_in(self, value: bool):
         self._filled_in = value
 
+    def __eq__(self, other):
+        if not isinstance(other, Reservoir):
+            return NotImplemented
+        return (self._volume, self._filled_in) == (other._volume, other._filled_in)
+
+    def __hash__(self):
+        return hash((self._volume, self._filled_in))
+
 
 class ReservoirSystem:
-    def __init__(self):
-        self._reservoirs = [Reservoir(), Reservoir(), Reservoir()]
+    def __init__(self, reservoirs_num: int = 3):
+        if reservoirs_num < 1:
+            raise ValueError("a reservoir system needs at least one reservoir")
+        # one fill flag per reservoir, the running count keeps info() independent of the farm size
+        self._filled_in = np.zeros(reservoirs_num, dtype=bool)
+        self._filled_count = 0
         self._current_reservoir_id = None
 
     def get_reservoirs_list(self):
-        return self._reservoirs.copy()
+        return [Reservoir(filled_in=filled_in) for filled_in in self._filled_in.tolist()]
+
+    def get_reservoir(self, _id: int) -> Reservoir:
+        return Reservoir(filled_in=bool(self._filled_in[_id]))
+
+    def get_reservoirs_count(self) -> int:
+        return len(self._filled_in)
+
+    @property
+    def filled_count(self) -> int:
+        return self._filled_count
+
+    @property
+    def empty_count(self) -> int:
+        return len(self._filled_in) - self._filled_count
 
     @property
     def current_reservoir_id(self):
         return self._current_reservoir_id
 
+    def snapshot(self) -> tuple:
+        return self._filled_in.tobytes(), self._filled_count, self._current_reservoir_id
+
+    def restore(self, state: tuple) -> None:
+        filled_in, self._filled_count, self._current_reservoir_id = state
+        self._filled_in[:] = np.frombuffer(filled_in, dtype=bool)
+
     def connect_to_reservoir(self):
-        self._current_reservoir_id = (self._current_reservoir_id + 1) % 3 if self._current_reservoir_id else 0
+        self._current_reservoir_id = (self._current_reservoir_id + 1) % len(self._filled_in) \
+            if self._current_reservoir_id is not None else 0
         return "Connection to the next reservoir is successful"
 
     def fill_reservoir(self):
         if self._current_reservoir_id is None:
             return "None of the reservoirs are connected"
-        if not self._reservoirs[self._current_reservoir_id].filled_in:
-            self._reservoirs[self._current_reservoir_id].filled_in = True
+        if not self._filled_in[self._current_reservoir_id]:
+            self._filled_in[self._current_reservoir_id] = True
+            self._filled_count += 1
             return "The reservoir is full"
         return "The reservoir is already full"
 
     def empty_reservoir(self):
         if self._current_reservoir_id is None:
             return "None of the reservoirs are connected"
-        if self._reservoirs[self._current_reservoir_id].filled_in:
-            self._reservoirs[self._current_reservoir_id].filled_in = False
+        if self._filled_in[self._current_reservoir_id]:
+            self._filled_in[self._current_reservoir_id] = False
+            self._filled_count -= 1
             return "The reservoir is empty"
         return "The reservoir is already empty"
 
+    def fill_range(self, start: int, stop: int) -> int:
+        # returns the number of reservoirs that were filled
+        reservoirs = self._filled_in[start:stop]
+        changed = len(reservoirs) - int(np.count_nonzero(reservoirs))
+        reservoirs[:] = True
+        self._filled_count += changed
+        return changed
+
+    def empty_range(self, start: int, stop: int) -> int:
+        # returns the number of reservoirs that were emptied
+        reservoirs = self._filled_in[start:stop]
+        changed = int(np.count_nonzero(reservoirs))
+        reservoirs[:] = False
+        self._filled_count -= changed
+        return changed
+
+    def info(self) -> str:
+        return f"{self._filled_count}/{len(self._filled_in)} filled, connected: {self._current_reservoir_id}"
+
+
+RESERVOIR_ERROR_MESSAGES = {"None of the reservoirs are connected", "Unknown command"}
+
 
+RESERVOIR_OPCODES = {"fill": 0, "next": 1, "empty": 2, "info": 3}
+
+
+@instrumented_handler("reservoir", 1, "command", RESERVOIR_OPCODES, lambda result: result in RESERVOIR_ERROR_MESSAGES)
 def reservoir_system_command_handler(system: ReservoirSystem, command: str) -> str:
     match command:
         case "fill":
@@ -58,11 +128,36 @@ def reservoir_system_command_handler(system: ReservoirSystem, command: str) -> s
         case "empty":
             return system.empty_reservoir()
         case "info":
-            return str(system.get_reservoirs_list()) + str(system.current_reservoir_id)
+            return system.info()
         case _:
             return "Unknown command"
 
 
+RESERVOIR_MESSAGES = ("The reservoir is full", "The reservoir is already full",
+                      "The reservoir is empty", "The reservoir is already empty",
+                      "Connection to the next reservoir is successful",
+                      "None of the reservoirs are connected", "Unknown command", "info")
+_RESERVOIR_CODES = {message: code for code, message in enumerate(RESERVOIR_MESSAGES)}
+RESERVOIR_INFO = _RESERVOIR_CODES["info"]
+RESERVOIR_UNKNOWN = _RESERVOIR_CODES["Unknown command"]
+
+
+def reservoir_system_batch_handler(system: ReservoirSystem, opcodes) -> BatchResult:
+    actions = (system.fill_reservoir, system.connect_to_reservoir, system.empty_reservoir)
+    opcodes = opcodes.tolist() if isinstance(opcodes, np.ndarray) else opcodes
+    codes = np.empty(len(opcodes), dtype=np.int8)
+    extra = {}
+    for i, opcode in enumerate(opcodes):
+        if opcode == RESERVOIR_OPCODES["info"]:
+            codes[i] = RESERVOIR_INFO
+            extra[i] = system.info()
+        elif 0 <= opcode < len(actions):
+            codes[i] = _RESERVOIR_CODES[actions[opcode]()]
+        else:
+            codes[i] = RESERVOIR_UNKNOWN
+    return BatchResult(codes, RESERVOIR_MESSAGES, extra)
+
+
 if __name__ == "__main__":
     system = ReservoirSystem()
 
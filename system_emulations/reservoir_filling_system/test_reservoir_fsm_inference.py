@@ -2,40 +2,46 @@ from aalpy import run_non_det_Lstar
 from aalpy.oracles import RandomWalkEqOracle
 from aalpy.learning_algs import run_Lstar
 
+from system_emulations.incremental_learning import relearn
+from system_emulations.query_cache import CachingSUL
 from system_emulations.test_locators import PATH_TO_RESULTS_DIR
 from system_emulations.test_sul import MicrofluidicSystemSUL
 
 
 def main():
     alphabet = ['fill', 'next', 'empty']
+    cache_path = PATH_TO_RESULTS_DIR.joinpath("Microfluidic_queries.cache")
 
-    sul = MicrofluidicSystemSUL()
+    sul = CachingSUL.from_file(MicrofluidicSystemSUL(), cache_path)
     eq_oracle = RandomWalkEqOracle(alphabet=alphabet, sul=sul, num_steps=1000,
                                    reset_prob=0.1)
     learned_model = run_non_det_Lstar(alphabet=alphabet, sul=sul,
                                       eq_oracle=eq_oracle)
     learned_model.save(PATH_TO_RESULTS_DIR.joinpath("Microfluidic_non_det_L"))
 
-    sul = MicrofluidicSystemSUL()
+    sul = CachingSUL(MicrofluidicSystemSUL(), sul.cache)
     eq_oracle = RandomWalkEqOracle(alphabet=alphabet, sul=sul, num_steps=1000,
                                    reset_prob=0.1)
     learned_model = run_Lstar(alphabet=alphabet, sul=sul, eq_oracle=eq_oracle,
                               automaton_type='dfa')
     learned_model.save(PATH_TO_RESULTS_DIR.joinpath("Microfluidic_L_dfa"))
 
-    sul = MicrofluidicSystemSUL()
+    sul = CachingSUL(MicrofluidicSystemSUL(), sul.cache)
     eq_oracle = RandomWalkEqOracle(alphabet=alphabet, sul=sul, num_steps=1000,
                                    reset_prob=0.1)
     learned_model = run_Lstar(alphabet=alphabet, sul=sul, eq_oracle=eq_oracle,
                               automaton_type='moore')
     learned_model.save(PATH_TO_RESULTS_DIR.joinpath("Microfluidic_L_moore"))
 
-    sul = MicrofluidicSystemSUL()
+    sul = CachingSUL(MicrofluidicSystemSUL(), sul.cache)
     eq_oracle = RandomWalkEqOracle(alphabet=alphabet, sul=sul, num_steps=1000,
                                    reset_prob=0.1)
-    learned_model = run_Lstar(alphabet=alphabet, sul=sul, eq_oracle=eq_oracle,
-                              automaton_type='mealy')
-    learned_model.save(PATH_TO_RESULTS_DIR.joinpath("Microfluidic_L_mealy"))
+    # repairs the previously saved model instead of learning it from scratch
+    model_path = PATH_TO_RESULTS_DIR.joinpath("Microfluidic_L_mealy")
+    learned_model = relearn(model_path, alphabet=alphabet, sul=sul, eq_oracle=eq_oracle,
+                            automaton_type='mealy')
+    learned_model.save(model_path)
+    sul.save(cache_path)
 
 
 if __name__ == "__main__":
@@ -1,22 +1,141 @@
+import hashlib
 import json
 import logging
+import struct
+from functools import lru_cache
+from pathlib import Path
+from collections.abc import Mapping
+from typing import NamedTuple
+
+import numpy as np
+
+from system_emulations.batch import BatchResult
+from system_emulations.instrumentation import instrumented_handler
+
+
+CONFIG_DIR = Path(__file__).resolve().parent
+REQUIRED_MODES = ("default", "cool", "dry", "heat")
+# mode code, locked and turbo bits, ventilation flags, overflow bits, temperature, fan speed, humidity
+STATE_RECORD = struct.Struct("<BBBBqqq")
+# compiled configs: magic and mode count, then per mode the name length, the name and its settings
+MODES_HEADER = struct.Struct("<4sH")
+MODES_MAGIC = b"HVM1"
+MODE_RECORD = struct.Struct("<qqq")
+NO_SENSOR_VALUE = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+LOCKED = 1
+TURBO = 2
+
+
+class ModeSettings(NamedTuple):
+    temperature: int
+    humidity: int
+    fan_speed: int
 
 
 def read_json(filename: str) -> dict:
+    with open(filename, "r") as f:
+        return json.load(f)
+
+
+class Modes(Mapping):
+    # a read-only {name: ModeSettings} table that, unlike MappingProxyType, can be pickled and copied
+    def __init__(self, modes: dict):
+        self._modes = dict(modes)
+
+    def __getitem__(self, name: str) -> ModeSettings:
+        return self._modes[name]
+
+    def __iter__(self):
+        return iter(self._modes)
+
+    def __len__(self):
+        return len(self._modes)
+
+    def __repr__(self):
+        return f"Modes({self._modes!r})"
+
+
+@lru_cache(maxsize=None)
+def default_config_path() -> Path:
+    config_path = CONFIG_DIR.joinpath("config.json")
+    if config_path.exists():
+        return config_path
+    return CONFIG_DIR.joinpath("config.json.sample")
+
+
+def parse_modes(config: dict) -> Modes:
+    if not isinstance(config, dict) or not isinstance(config.get("modes"), dict):
+        raise ValueError('config must contain a "modes" object')
+    modes = {}
+    for name, settings in config["modes"].items():
+        try:
+            mode = ModeSettings(**settings)
+        except TypeError:
+            raise ValueError(f'mode "{name}" must set exactly temperature, humidity and fan_speed')
+        if not all(isinstance(value, int) for value in mode):
+            raise ValueError(f'mode "{name}" settings must be integers')
+        if mode.humidity not in range(0, 101) or mode.fan_speed not in range(0, 101):
+            raise ValueError(f'mode "{name}" humidity and fan speed must be in the range from 0 to 100')
+        modes[name] = mode
+    missing = [name for name in REQUIRED_MODES if name not in modes]
+    if missing:
+        raise ValueError(f"config misses modes: {', '.join(missing)}")
+    return Modes(modes)
+
+
+@lru_cache(maxsize=None)
+def load_modes(path: str) -> Modes:
+    if path.endswith(".modes"):
+        return parse_modes(read_compiled_modes(path))
+    return parse_modes(read_json(path))
+
+
+def read_compiled_modes(path: str) -> dict:
+    with open(path, "rb") as f:
+        data = f.read()
     try:
-        with open(filename, "r") as f:
-            return json.load(f)
-    except FileNotFoundError as e:
-        print(e)
+        magic, count = MODES_HEADER.unpack_from(data)
+        if magic != MODES_MAGIC:
+            raise ValueError(f"{path} is not a compiled modes config")
+        modes = {}
+        offset = MODES_HEADER.size
+        for _ in range(count):
+            length = data[offset]
+            name = data[offset + 1:offset + 1 + length].decode()
+            offset += 1 + length
+            temperature, humidity, fan_speed = MODE_RECORD.unpack_from(data, offset)
+            offset += MODE_RECORD.size
+            modes[name] = {"temperature": temperature, "humidity": humidity, "fan_speed": fan_speed}
+    except (struct.error, IndexError, UnicodeDecodeError):
+        raise ValueError(f"{path} is a truncated or corrupt compiled modes config")
+    return {"modes": modes}
+
+
+def compile_modes(source: str, target: str) -> None:
+    modes = parse_modes(read_json(source))
+    data = [MODES_HEADER.pack(MODES_MAGIC, len(modes))]
+    for name, mode in modes.items():
+        encoded = name.encode()
+        if len(encoded) > 255:
+            raise ValueError(f'mode name "{name}" is too long')
+        data += [bytes((len(encoded),)), encoded, MODE_RECORD.pack(*mode)]
+    with open(target, "wb") as f:
+        f.write(b"".join(data))
 
 
 class VentilationSystemSensors:
+    __slots__ = ('temperature', 'fan_speed', 'humidity')
+
     def __init__(self, temperature: int | None = None,
                  fan_speed: int | None = None, humidity: int | None = None):
         self.temperature = temperature
         self.fan_speed = fan_speed
         self.humidity = humidity
 
+    def to_tuple(self) -> tuple:
+        return self.temperature, self.fan_speed, self.humidity
+
     def to_dict(self):
         return {
             'temperature': self.temperature,
@@ -24,18 +143,77 @@ class VentilationSystemSensors:
             'humidity': self.humidity
         }
 
+    def __eq__(self, other):
+        if not isinstance(other, VentilationSystemSensors):
+            return NotImplemented
+        return self.to_tuple() == other.to_tuple()
+
+    def __hash__(self):
+        return hash(self.to_tuple())
+
+
+VENTILATION_ON = 1
+CONDITIONER_ON = 2
+HUMIDIFIER_ON = 4
+LED_DISPLAY = 8
+
+
+def sensor_field(value) -> tuple:
+    # the int64 field of a sensor value and whether it overflowed: values the field cannot
+    # hold, and its minimum that marks no value, are kept as a 64-bit hash of the value
+    if value is None:
+        return NO_SENSOR_VALUE, False
+    if NO_SENSOR_VALUE < value <= INT64_MAX:
+        return value, False
+    digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True), True
+
+
+def pack_state_record(mode_code: int, locked: bool, turbo: bool, flags: int, sensors: tuple) -> bytes:
+    fields, overflows = zip(*map(sensor_field, sensors))
+    return STATE_RECORD.pack(mode_code, (locked and LOCKED) | (turbo and TURBO), flags,
+                             sum(1 << i for i, overflow in enumerate(overflows) if overflow), *fields)
+
+
+def _same_value(old, new) -> bool:
+    # True and 1 compare equal but are reported differently
+    return type(old) is type(new) and old == new
+
+
+def _flag(bit: int):
+    def getter(self) -> bool:
+        return bool(self.flags & bit)
+
+    def setter(self, value: bool):
+        self.flags = self.flags | bit if value else self.flags & ~bit
+    return property(getter, setter)
+
 
 class WorkingVentilationElements:
+    __slots__ = ('flags', 'sensors')
+
+    ventilation_on = _flag(VENTILATION_ON)
+    conditioner_on = _flag(CONDITIONER_ON)
+    humidifier_on = _flag(HUMIDIFIER_ON)
+    led_display = _flag(LED_DISPLAY)
+
     def __init__(self, ventilation: bool = False, conditioner: bool = False,
                  humidifier: bool = False,
                  led_display: bool = False,
                  sensors: VentilationSystemSensors = VentilationSystemSensors()):
-        self.ventilation_on = ventilation
-        self.conditioner_on = conditioner
-        self.humidifier_on = humidifier
-        self.led_display = led_display
+        # all False would be False, not 0
+        self.flags = int((ventilation and VENTILATION_ON) | (conditioner and CONDITIONER_ON) |
+                         (humidifier and HUMIDIFIER_ON) | (led_display and LED_DISPLAY))
         self.sensors = sensors
 
+    def to_tuple(self) -> tuple:
+        return self.flags, self.sensors.to_tuple()
+
+    def load_tuple(self, state: tuple) -> None:
+        self.flags, sensors = state
+        self.sensors.temperature, self.sensors.fan_speed, \
+            self.sensors.humidity = sensors
+
     def to_dict(self):
         return {
             'ventilation_on': self.ventilation_on,
@@ -45,13 +223,21 @@ class WorkingVentilationElements:
             'sensors': self.sensors.to_dict()
         }
 
+    def __eq__(self, other):
+        if not isinstance(other, WorkingVentilationElements):
+            return NotImplemented
+        return self.to_tuple() == other.to_tuple()
+
+    def __hash__(self):
+        return hash(self.to_tuple())
+
 
 class SplitSystemController:
-    config_filename = "config.json"
+    config_filename = None
 
-    def __init__(self):
-        self.config = read_json(self.config_filename)
-        self._modes = self.config["modes"]
+    def __init__(self, modes: Modes | None = None):
+        self._modes = modes if modes is not None else \
+            load_modes(str(self.config_filename or default_config_path()))
 
         self._mode = None
         self._locked = False
@@ -61,6 +247,12 @@ class SplitSystemController:
         self._ventilation.sensors = self.default_sensors_settings
         self._last_ventilation_state = WorkingVentilationElements()
 
+        # 0 is no mode, "fan" is not configured but always accepted
+        self._mode_codes = {None: 0}
+        for name in (*self._modes, "fan"):
+            self._mode_codes.setdefault(name, len(self._mode_codes))
+        self._state_changed()
+
     def get_locked(self):
         return self._locked
 
@@ -79,26 +271,38 @@ class SplitSystemController:
     def get_mode(self):
         return self._mode
 
+    def get_modes(self):
+        return self._modes
+
     @property
     def default_sensors_settings(self):
         return VentilationSystemSensors(
-            temperature=self._modes["default"]["temperature"],
-            humidity=self._modes["default"]["humidity"],
-            fan_speed=self._modes["default"]["fan_speed"]
+            temperature=self._modes["default"].temperature,
+            humidity=self._modes["default"].humidity,
+            fan_speed=self._modes["default"].fan_speed
         )
 
+    def _state_changed(self):
+        # drops the cached outputs, every mutator calls it once the state really changed
+        self._info = None
+        self._record = None
+        self._digest = None
+
     def stop_working(self):
         if self._locked:
             raise Exception("ERR System is locked.")
 
-        self._ventilation.ventilation_on = False
-        self._ventilation.conditioner_on = False
-        self._ventilation.humidifier_on = False
+        if self._ventilation.flags & (VENTILATION_ON | CONDITIONER_ON | HUMIDIFIER_ON):
+            self._ventilation.ventilation_on = False
+            self._ventilation.conditioner_on = False
+            self._ventilation.humidifier_on = False
+            self._state_changed()
 
     def manage_ventilation(self):
         if self._locked:
             raise Exception("ERR System is locked.")
         self._ventilation.ventilation_on = not self._ventilation.ventilation_on
+        self._state_changed()
 
     def manage_conditioner(self):
         if self._locked:
@@ -107,6 +311,7 @@ class SplitSystemController:
         self._ventilation.conditioner_on = not self._ventilation.conditioner_on
         if self._ventilation.conditioner_on and not self._ventilation.ventilation_on:
             self._ventilation.ventilation_on = True
+        self._state_changed()
 
     def manage_humidifier(self):
         if self._locked:
@@ -115,6 +320,7 @@ class SplitSystemController:
         self._ventilation.humidifier_on = not self._ventilation.humidifier_on
         if self._ventilation.humidifier_on and not self._ventilation.ventilation_on:
             self._ventilation.ventilation_on = True
+        self._state_changed()
 
     def set_temperature(self, value: int):
         if self._locked:
@@ -122,8 +328,10 @@ class SplitSystemController:
         if not isinstance(value, int):
             raise Exception("ERR Invalid value type.")
 
-        self._mode = None
-        self._ventilation.sensors.temperature = value
+        if self._mode is not None or not _same_value(self._ventilation.sensors.temperature, value):
+            self._mode = None
+            self._ventilation.sensors.temperature = value
+            self._state_changed()
 
     def set_humidity(self, value: int):
         if self._locked:
@@ -133,8 +341,10 @@ class SplitSystemController:
         if value not in range(0, 101):
             raise Exception("ERR Invalid value.")
 
-        self._mode = None
-        self._ventilation.sensors.humidity = value
+        if self._mode is not None or not _same_value(self._ventilation.sensors.humidity, value):
+            self._mode = None
+            self._ventilation.sensors.humidity = value
+            self._state_changed()
 
     def set_fan_speed(self, value: int):
         if self._locked:
@@ -144,7 +354,9 @@ class SplitSystemController:
         if value not in range(0, 101):
             raise Exception("ERR Invalid value.")
 
-        self._ventilation.sensors.fan_speed = value
+        if not _same_value(self._ventilation.sensors.fan_speed, value):
+            self._ventilation.sensors.fan_speed = value
+            self._state_changed()
 
     def submode_turbo(self):
         if self._locked:
@@ -156,17 +368,19 @@ class SplitSystemController:
             self.set_fan_speed(100)
         else:
             self._ventilation = self._last_ventilation_state
+        self._state_changed()
 
     def change_mode(self, mode_name):
         if self._locked:
             raise Exception("ERR System is locked.")
-        if self._mode:
-            if self._mode != mode_name:
-                raise Exception(f"ERR Other mode is already used.")
+        if self._mode and self._mode != mode_name:
+            raise Exception(f"ERR Other mode is already used.")
 
-            else:
-                self._mode = None
-                self._ventilation = self._last_ventilation_state
+        # dropped first, an unknown mode name fails after the mode was switched
+        self._state_changed()
+        if self._mode:
+            self._mode = None
+            self._ventilation = self._last_ventilation_state
 
         else:
             self._last_ventilation_state = self._ventilation
@@ -177,13 +391,14 @@ class SplitSystemController:
                 self._ventilation.conditioner_on = False
             else:
                 self._ventilation.sensors = VentilationSystemSensors(
-                    temperature=self._modes[mode_name]["temperature"],
-                    fan_speed=self._modes[mode_name]["humidity"],
-                    humidity=self._modes[mode_name]["fan_speed"]
+                    temperature=self._modes[mode_name].temperature,
+                    fan_speed=self._modes[mode_name].humidity,
+                    humidity=self._modes[mode_name].fan_speed
                 )
 
     def lock(self):
         self._locked = not self._locked
+        self._state_changed()
 
     def reset(self):
         self._mode = None
@@ -193,6 +408,25 @@ class SplitSystemController:
         self._ventilation = WorkingVentilationElements()
         self._ventilation.sensors = self.default_sensors_settings
         self._last_ventilation_state = WorkingVentilationElements()
+        self._state_changed()
+
+    def snapshot(self) -> tuple:
+        # None marks the last ventilation state as an alias of the current one
+        last_state = None if self._last_ventilation_state is self._ventilation \
+            else self._last_ventilation_state.to_tuple()
+        return (self._mode, self._locked, self._fan_mode_turbo,
+                self._ventilation.to_tuple(), last_state)
+
+    def restore(self, state: tuple) -> None:
+        self._mode, self._locked, self._fan_mode_turbo, ventilation, last_state = state
+        self._ventilation.load_tuple(ventilation)
+        if last_state is None:
+            self._last_ventilation_state = self._ventilation
+        else:
+            self._last_ventilation_state = WorkingVentilationElements(
+                sensors=VentilationSystemSensors())
+            self._last_ventilation_state.load_tuple(last_state)
+        self._state_changed()
 
     def get_led_display(self):
         return self._ventilation.led_display
@@ -202,14 +436,36 @@ class SplitSystemController:
             raise Exception("ERR System is locked.")
         self._ventilation.led_display = not self._ventilation.led_display
         self._last_ventilation_state.led_display = self._ventilation.led_display
+        self._state_changed()
 
     def info(self):
-        return json.dumps({"mode": self._mode,
-                "is_locked": self._locked,
-                "turbo_mode": self._fan_mode_turbo,
-                "ventilation": self._ventilation.to_dict()})
+        if self._info is None:
+            self._info = json.dumps({"mode": self._mode,
+                                     "is_locked": self._locked,
+                                     "turbo_mode": self._fan_mode_turbo,
+                                     "ventilation": self._ventilation.to_dict()})
+        return self._info
+
+    def state_record(self) -> bytes:
+        # the observable state of info() in the fixed STATE_RECORD layout
+        if self._record is None:
+            self._record = pack_state_record(self._mode_codes.get(self._mode, len(self._mode_codes)),
+                                             self._locked, self._fan_mode_turbo, self._ventilation.flags,
+                                             self._ventilation.sensors.to_tuple())
+        return self._record
+
+    def state_digest(self) -> int:
+        if self._digest is None:
+            digest = hashlib.blake2b(self.state_record(), digest_size=8).digest()
+            self._digest = int.from_bytes(digest, "little")
+        return self._digest
 
 
+SPLIT_SYSTEM_OPCODES = {cmd: opcode for opcode, cmd in enumerate(
+    ('s0', 's1', 's2', 's3', 'ST', 'SH', 'SF', 'SMt', 'Mc', 'Md', 'Mh', 'Mf', 'l', 'r', 'ld', 'I', 'Ir', 'Id'))}
+
+
+@instrumented_handler("split_system", 1, "cmd", SPLIT_SYSTEM_OPCODES, lambda result: result.startswith("ERR"))
 def split_system_command_handler(system: SplitSystemController, cmd: str,
                                  val: int = None) -> str:
     try:
@@ -261,12 +517,122 @@ def split_system_command_handler(system: SplitSystemController, cmd: str,
                 return f"OK LED display {'enabled' if system.get_led_display() else 'disabled'}."
             case 'I':
                 return system.info()
+            case 'Ir':
+                return system.state_record().hex()
+            case 'Id':
+                return f"{system.state_digest():016x}"
             case _:
                 return "ERR Unknown command"
     except Exception as e:
         return str(e.args[0])
 
 
+SPLIT_SYSTEM_MESSAGES = (
+    "OK System disabled.",
+    "OK Ventilation enabled.", "OK Ventilation disabled.",
+    "OK Air conditioning enabled.", "OK Air conditioning disabled.",
+    "OK Humidification system enabled.", "OK Humidification system disabled.",
+    "OK Temperature is set.", "OK Humidity is set.", "OK Fan speed is set.",
+    "OK Turbo mode enabled", "OK Turbo mode disabled",
+    "OK Cool mode enabled.", "OK Cool mode disabled.",
+    "OK Dry mode enabled.", "OK Dry mode disabled.",
+    "OK Heat mode enabled.", "OK Heat mode disabled.",
+    "OK Fan mode enabled.", "OK Fan mode disabled.",
+    "OK Parameters locked.", "OK Parameters unlocked.",
+    "OK Parameters reset to default.",
+    "OK LED display enabled.", "OK LED display disabled.",
+    "info",
+    "ERR Unknown command",
+    "ERR System is locked.",
+    "ERR Invalid value type.",
+    "ERR Invalid value.",
+    "ERR Other mode is already used.",
+    "error",
+)
+_SPLIT_SYSTEM_CODES = {message: code for code, message in enumerate(SPLIT_SYSTEM_MESSAGES)}
+SPLIT_SYSTEM_INFO = _SPLIT_SYSTEM_CODES["info"]
+SPLIT_SYSTEM_UNKNOWN = _SPLIT_SYSTEM_CODES["ERR Unknown command"]
+SPLIT_SYSTEM_ERROR = _SPLIT_SYSTEM_CODES["error"]
+
+
+def _toggle(action, getter, message: str):
+    enabled = _SPLIT_SYSTEM_CODES[message]
+
+    def run(system, _val):
+        action(system)
+        return enabled if getter(system) else enabled + 1
+    return run
+
+
+def _done(action, message: str, with_value: bool = False):
+    code = _SPLIT_SYSTEM_CODES[message]
+
+    def run(system, val):
+        action(system, val) if with_value else action(system)
+        return code
+    return run
+
+
+_SPLIT_SYSTEM_ACTIONS = (
+    _done(SplitSystemController.stop_working, "OK System disabled."),
+    _toggle(SplitSystemController.manage_ventilation, SplitSystemController.get_ventilation,
+            "OK Ventilation enabled."),
+    _toggle(SplitSystemController.manage_conditioner, SplitSystemController.get_conditioner,
+            "OK Air conditioning enabled."),
+    _toggle(SplitSystemController.manage_humidifier, SplitSystemController.get_humidifier,
+            "OK Humidification system enabled."),
+    _done(SplitSystemController.set_temperature, "OK Temperature is set.", True),
+    _done(SplitSystemController.set_humidity, "OK Humidity is set.", True),
+    _done(SplitSystemController.set_fan_speed, "OK Fan speed is set.", True),
+    _toggle(SplitSystemController.submode_turbo, SplitSystemController.get_fan_mode,
+            "OK Turbo mode enabled"),
+    _toggle(lambda system: system.change_mode("cool"), SplitSystemController.get_mode,
+            "OK Cool mode enabled."),
+    _toggle(lambda system: system.change_mode("dry"), SplitSystemController.get_mode,
+            "OK Dry mode enabled."),
+    _toggle(lambda system: system.change_mode("heat"), SplitSystemController.get_mode,
+            "OK Heat mode enabled."),
+    _toggle(lambda system: system.change_mode("fan"), SplitSystemController.get_mode,
+            "OK Fan mode enabled."),
+    _toggle(SplitSystemController.lock, SplitSystemController.get_locked,
+            "OK Parameters locked."),
+    _done(SplitSystemController.reset, "OK Parameters reset to default."),
+    _toggle(SplitSystemController.led_display, SplitSystemController.get_led_display,
+            "OK LED display enabled."),
+)
+
+
+def split_system_batch_handler(system: SplitSystemController, opcodes, values=None) -> BatchResult:
+    opcodes = opcodes.tolist() if isinstance(opcodes, np.ndarray) else opcodes
+    if values is None:
+        values = [None] * len(opcodes)
+    elif isinstance(values, np.ndarray):
+        values = values.tolist()
+    codes = np.empty(len(opcodes), dtype=np.int8)
+    extra = {}
+    for i, (opcode, val) in enumerate(zip(opcodes, values)):
+        try:
+            if opcode == SPLIT_SYSTEM_OPCODES['I']:
+                codes[i] = SPLIT_SYSTEM_INFO
+                extra[i] = system.info()
+            elif opcode == SPLIT_SYSTEM_OPCODES['Ir']:
+                codes[i] = SPLIT_SYSTEM_INFO
+                extra[i] = system.state_record().hex()
+            elif opcode == SPLIT_SYSTEM_OPCODES['Id']:
+                codes[i] = SPLIT_SYSTEM_INFO
+                extra[i] = f"{system.state_digest():016x}"
+            elif 0 <= opcode < len(_SPLIT_SYSTEM_ACTIONS):
+                codes[i] = _SPLIT_SYSTEM_ACTIONS[opcode](system, val)
+            else:
+                codes[i] = SPLIT_SYSTEM_UNKNOWN
+        except Exception as e:
+            code = _SPLIT_SYSTEM_CODES.get(e.args[0] if e.args else None, SPLIT_SYSTEM_ERROR)
+            codes[i] = code
+            if code == SPLIT_SYSTEM_ERROR:
+                extra[i] = str(e.args[0] if e.args else e)
+    return BatchResult(codes, SPLIT_SYSTEM_MESSAGES, extra)
+
+
 def logger_init():
     fmt = '[%(asctime)s] %(levelname)-8s %(message)s'
     logging.basicConfig(level=logging.DEBUG, filename="file.log",
@@ -0,0 +1,317 @@
+import hashlib
+import json
+
+import numpy as np
+
+from system_emulations.batch import BatchResult
+from system_emulations.split_system.split_system_controller import SplitSystemController, \
+    SPLIT_SYSTEM_MESSAGES, SPLIT_SYSTEM_OPCODES, NO_SENSOR_VALUE, INT64_MAX, VENTILATION_ON, CONDITIONER_ON, \
+    HUMIDIFIER_ON, LED_DISPLAY, Modes, default_config_path, load_modes, pack_state_record
+
+FLEET_MESSAGES = SPLIT_SYSTEM_MESSAGES + ("skipped",)
+_CODES = {message: code for code, message in enumerate(FLEET_MESSAGES)}
+FLEET_SKIPPED = _CODES["skipped"]
+FLEET_INFO = _CODES["info"]
+
+# sensor columns in VentilationSystemSensors.to_tuple order
+TEMPERATURE, FAN_SPEED, HUMIDITY = range(3)
+_TOGGLES = {'s1': VENTILATION_ON, 's2': CONDITIONER_ON, 's3': HUMIDIFIER_ON}
+_MODE_COMMANDS = {'Mc': ("cool", "Cool"), 'Md': ("dry", "Dry"), 'Mh': ("heat", "Heat"), 'Mf': ("fan", "Fan")}
+_UNLOCKED_COMMANDS = ('l', 'r', 'I', 'Ir', 'Id')
+_SWITCHES_OFF = np.uint8(0xFF & ~(VENTILATION_ON | CONDITIONER_ON | HUMIDIFIER_ON))
+_FAN_ONLY_OFF = np.uint8(0xFF & ~(CONDITIONER_ON | HUMIDIFIER_ON))
+_LED_OFF = np.uint8(0xFF & ~LED_DISPLAY)
+# the ranges of valid sensor values per setter, None for any integer
+TEMPERATURE_RANGE = None
+PERCENT_RANGE = (0, 100)
+
+
+def _sensor(value: int, is_bool: bool):
+    if value == NO_SENSOR_VALUE:
+        return None
+    return bool(value) if is_bool else value
+
+
+def _value_error(value, valid_range: tuple | None) -> str | None:
+    # the checks of the controller setters in their order
+    if not isinstance(value, int):
+        return "ERR Invalid value type."
+    if valid_range is not None and not valid_range[0] <= value <= valid_range[1]:
+        return "ERR Invalid value."
+    return None
+
+
+def _fits(value) -> bool:
+    # NO_SENSOR_VALUE marks no value in the sensor columns
+    return NO_SENSOR_VALUE < value <= INT64_MAX
+
+
+class SplitSystemFleet:
+    # the state of many SplitSystemController units in columns, commands are applied to
+    # masked subsets of the units and report a result code per unit instead of raising
+    def __init__(self, units_num: int, modes: Modes | None = None):
+        self._modes = modes if modes is not None else \
+            load_modes(str(SplitSystemController.config_filename or default_config_path()))
+        # the same mode codes as SplitSystemController.state_record
+        self._mode_names = [None]
+        for name in (*self._modes, "fan"):
+            if name not in self._mode_names:
+                self._mode_names.append(name)
+        self._mode_codes = {name: code for code, name in enumerate(self._mode_names)}
+        # mode sensors in column order, change_mode stores humidity as the fan speed and back
+        self._mode_sensors = np.array([tuple(self._modes[name]) if name in self._modes else
+                                       (NO_SENSOR_VALUE,) * 3 for name in self._mode_names], dtype=np.int64)
+
+        self.units_num = units_num
+        self.mode = np.zeros(units_num, dtype=np.int8)
+        self.locked = np.zeros(units_num, dtype=bool)
+        self.turbo = np.zeros(units_num, dtype=bool)
+        self.flags = np.zeros(units_num, dtype=np.uint8)
+        self.sensors = np.empty((units_num, 3), dtype=np.int64)
+        # the controller keeps bools it was given as sensor values, info and snapshots show them as such
+        self.sensor_is_bool = np.zeros((units_num, 3), dtype=bool)
+        # values that do not fit the sensor columns, by (unit, column), where sensor_is_big is set
+        self.sensor_is_big = np.zeros((units_num, 3), dtype=bool)
+        self.big_sensors = {}
+        # the last ventilation state is only kept for units where it is not an alias of the current one
+        self.last_is_current = np.zeros(units_num, dtype=bool)
+        self.last_flags = np.zeros(units_num, dtype=np.uint8)
+        self.last_sensors = np.empty((units_num, 3), dtype=np.int64)
+        self.last_sensor_is_bool = np.zeros((units_num, 3), dtype=bool)
+        self.last_sensor_is_big = np.zeros((units_num, 3), dtype=bool)
+        self.last_big_sensors = {}
+        self._reset(np.arange(units_num))
+
+    def _reset(self, units: np.ndarray) -> None:
+        default = self._modes["default"]
+        self.mode[units] = 0
+        self.locked[units] = False
+        self.turbo[units] = False
+        self.flags[units] = 0
+        self.sensors[units] = (default.temperature, default.fan_speed, default.humidity)
+        self.sensor_is_bool[units] = False
+        self.sensor_is_big[units] = False
+        self.last_is_current[units] = False
+        self.last_flags[units] = 0
+        self.last_sensors[units] = NO_SENSOR_VALUE
+        self.last_sensor_is_bool[units] = False
+        self.last_sensor_is_big[units] = False
+
+    def _load_last(self, units: np.ndarray) -> None:
+        units = units[~self.last_is_current[units]]
+        self.flags[units] = self.last_flags[units]
+        self.sensors[units] = self.last_sensors[units]
+        self.sensor_is_bool[units] = self.last_sensor_is_bool[units]
+        self.sensor_is_big[units] = self.last_sensor_is_big[units]
+        for unit, column in zip(*np.nonzero(self.last_sensor_is_big[units])):
+            key = (int(units[unit]), int(column))
+            self.big_sensors[key] = self.last_big_sensors[key]
+        self.last_is_current[units] = True
+
+    def _toggle_codes(self, enabled: np.ndarray, message: str) -> np.ndarray:
+        return np.where(enabled, _CODES[message], _CODES[message] + 1).astype(np.int8)
+
+    def _checked_values(self, values, units: np.ndarray, codes: np.ndarray, valid_range: tuple | None) -> tuple:
+        # the units with a valid value, their values and whether these are bools or too big for
+        # the sensor columns, the other units get the error code of the controller setter for their own value
+        if isinstance(values, np.generic):
+            values = np.asarray(values)
+        if isinstance(values, np.ndarray) and (np.issubdtype(values.dtype, np.integer) or values.dtype == bool):
+            values = np.broadcast_to(values, self.units_num)[units]
+            if valid_range is not None:
+                valid = (values >= valid_range[0]) & (values <= valid_range[1])
+                codes[units[~valid]] = _CODES["ERR Invalid value."]
+                units, values = units[valid], values[valid]
+            if values.dtype == np.uint64 or values.dtype == np.int64:
+                big = (values > INT64_MAX) if values.dtype == np.uint64 else (values == NO_SENSOR_VALUE)
+                if big.any():
+                    return self._with_big_values(units, values.tolist(), values.dtype == bool)
+            return units, values.astype(np.int64), np.full(len(units), values.dtype == bool), \
+                np.zeros(len(units), dtype=bool), {}
+
+        if isinstance(values, (list, tuple)) or (isinstance(values, np.ndarray) and values.ndim > 0):
+            if len(values) != self.units_num:
+                raise ValueError(f"values must be a scalar or have one value per unit, got {len(values)}")
+            values = values.tolist() if isinstance(values, np.ndarray) else values
+            values = [values[unit] for unit in units.tolist()]
+        else:
+            values = [values.item() if isinstance(values, np.ndarray) else values] * len(units)
+        errors = [_value_error(value, valid_range) for value in values]
+        valid = np.array([error is None for error in errors], dtype=bool)
+        for unit, error in zip(units.tolist(), errors):
+            if error is not None:
+                codes[unit] = _CODES[error]
+        values = [value for value, error in zip(values, errors) if error is None]
+        return self._with_big_values(units[valid], values, [isinstance(value, bool) for value in values])
+
+    @staticmethod
+    def _with_big_values(units: np.ndarray, values: list, is_bool) -> tuple:
+        big = np.array([not _fits(value) for value in values], dtype=bool)
+        big_values = {unit: value for unit, value in zip(units.tolist(), values) if not _fits(value)}
+        column = np.array([value if _fits(value) else 0 for value in values], dtype=np.int64)
+        return units, column, np.broadcast_to(np.asarray(is_bool, dtype=bool), len(units)), big, big_values
+
+    def _set_sensor(self, units: np.ndarray, column: int, checked: tuple) -> None:
+        _, values, is_bool, big, big_values = checked
+        self.sensors[units, column] = values
+        self.sensor_is_bool[units, column] = is_bool
+        self.sensor_is_big[units, column] = big
+        for unit, value in big_values.items():
+            self.big_sensors[(unit, column)] = value
+
+    def apply(self, cmd: str, mask: np.ndarray | None = None, values=None) -> BatchResult:
+        # mask: boolean array over the units, values: a scalar or an array over all units
+        codes = np.full(self.units_num, FLEET_SKIPPED, dtype=np.int8)
+        units = np.arange(self.units_num) if mask is None else np.flatnonzero(mask)
+        extra = {}
+        if cmd in SPLIT_SYSTEM_OPCODES and cmd not in _UNLOCKED_COMMANDS:
+            locked = self.locked[units]
+            codes[units[locked]] = _CODES["ERR System is locked."]
+            units = units[~locked]
+
+        match cmd:
+            case 's0':
+                self.flags[units] &= _SWITCHES_OFF
+                codes[units] = _CODES["OK System disabled."]
+            case 's1':
+                self.flags[units] ^= VENTILATION_ON
+                codes[units] = self._toggle_codes(self.flags[units] & VENTILATION_ON, "OK Ventilation enabled.")
+            case 's2' | 's3':
+                bit = _TOGGLES[cmd]
+                flags = self.flags[units] ^ bit
+                flags[(flags & bit) != 0] |= VENTILATION_ON
+                self.flags[units] = flags
+                codes[units] = self._toggle_codes(flags & bit, "OK Air conditioning enabled." if cmd == 's2'
+                                                  else "OK Humidification system enabled.")
+            case 'ST':
+                checked = self._checked_values(values, units, codes, TEMPERATURE_RANGE)
+                units = checked[0]
+                self.mode[units] = 0
+                self._set_sensor(units, TEMPERATURE, checked)
+                codes[units] = _CODES["OK Temperature is set."]
+            case 'SH':
+                checked = self._checked_values(values, units, codes, PERCENT_RANGE)
+                units = checked[0]
+                self.mode[units] = 0
+                self._set_sensor(units, HUMIDITY, checked)
+                codes[units] = _CODES["OK Humidity is set."]
+            case 'SF':
+                checked = self._checked_values(values, units, codes, PERCENT_RANGE)
+                units = checked[0]
+                self._set_sensor(units, FAN_SPEED, checked)
+                codes[units] = _CODES["OK Fan speed is set."]
+            case 'SMt':
+                turbo = ~self.turbo[units]
+                self.turbo[units] = turbo
+                self.last_is_current[units[turbo]] = True
+                self.sensors[units[turbo], FAN_SPEED] = 100
+                self.sensor_is_bool[units[turbo], FAN_SPEED] = False
+                self.sensor_is_big[units[turbo], FAN_SPEED] = False
+                self._load_last(units[~turbo])
+                codes[units] = self._toggle_codes(turbo, "OK Turbo mode enabled")
+            case 'Mc' | 'Md' | 'Mh' | 'Mf':
+                name, title = _MODE_COMMANDS[cmd]
+                code = self._mode_codes[name]
+                mode = self.mode[units]
+                codes[units[(mode != 0) & (mode != code)]] = _CODES["ERR Other mode is already used."]
+                leaving = units[mode == code]
+                self.mode[leaving] = 0
+                self._load_last(leaving)
+                codes[leaving] = _CODES[f"OK {title} mode disabled."]
+                entering = units[mode == 0]
+                self.last_is_current[entering] = True
+                self.mode[entering] = code
+                if name == "fan":
+                    self.flags[entering] = (self.flags[entering] | VENTILATION_ON) & _FAN_ONLY_OFF
+                else:
+                    self.sensors[entering] = self._mode_sensors[code]
+                    self.sensor_is_bool[entering] = False
+                    self.sensor_is_big[entering] = False
+                codes[entering] = _CODES[f"OK {title} mode enabled."]
+            case 'l':
+                locked = ~self.locked[units]
+                self.locked[units] = locked
+                codes[units] = self._toggle_codes(locked, "OK Parameters locked.")
+            case 'r':
+                self._reset(units)
+                codes[units] = _CODES["OK Parameters reset to default."]
+            case 'ld':
+                self.flags[units] ^= LED_DISPLAY
+                separate = units[~self.last_is_current[units]]
+                self.last_flags[separate] = (self.last_flags[separate] & _LED_OFF) | \
+                    (self.flags[separate] & LED_DISPLAY)
+                codes[units] = self._toggle_codes(self.flags[units] & LED_DISPLAY, "OK LED display enabled.")
+            case 'I' | 'Ir' | 'Id':
+                # the replies of split_system_command_handler
+                reply = {'I': self.info, 'Ir': lambda unit: self.state_record(unit).hex(),
+                         'Id': lambda unit: f"{self.state_digest(unit):016x}"}[cmd]
+                codes[units] = FLEET_INFO
+                extra = {unit: reply(unit) for unit in units.tolist()}
+            case _:
+                codes[units] = _CODES["ERR Unknown command"]
+        return BatchResult(codes, FLEET_MESSAGES, extra)
+
+    def _sensors(self, unit: int, last: bool = False) -> tuple:
+        values, is_bool, is_big, big_values = \
+            (self.last_sensors, self.last_sensor_is_bool, self.last_sensor_is_big, self.last_big_sensors) if last \
+            else (self.sensors, self.sensor_is_bool, self.sensor_is_big, self.big_sensors)
+        return tuple(big_values[(unit, column)] if big else _sensor(value, flag)
+                     for column, (value, flag, big) in enumerate(zip(values[unit].tolist(), is_bool[unit].tolist(),
+                                                                     is_big[unit].tolist())))
+
+    def _load_sensors(self, unit: int, sensors: tuple, last: bool = False) -> None:
+        values, is_bool, is_big, big_values = \
+            (self.last_sensors, self.last_sensor_is_bool, self.last_sensor_is_big, self.last_big_sensors) if last \
+            else (self.sensors, self.sensor_is_bool, self.sensor_is_big, self.big_sensors)
+        for column, value in enumerate(sensors):
+            big = value is not None and not _fits(value)
+            values[unit, column] = NO_SENSOR_VALUE if value is None else 0 if big else value
+            is_bool[unit, column] = isinstance(value, bool)
+            is_big[unit, column] = big
+            if big:
+                big_values[(unit, column)] = value
+
+    def snapshot(self, unit: int) -> tuple:
+        # the SplitSystemController.snapshot of a unit
+        ventilation = (int(self.flags[unit]), self._sensors(unit))
+        last_state = None if self.last_is_current[unit] else (int(self.last_flags[unit]), self._sensors(unit, True))
+        return (self._mode_names[self.mode[unit]], bool(self.locked[unit]), bool(self.turbo[unit]),
+                ventilation, last_state)
+
+    def restore(self, unit: int, state: tuple) -> None:
+        mode, locked, turbo, (flags, sensors), last_state = state
+        self.mode[unit] = self._mode_codes[mode]
+        self.locked[unit] = locked
+        self.turbo[unit] = turbo
+        self.flags[unit] = flags
+        self._load_sensors(unit, sensors)
+        self.last_is_current[unit] = last_state is None
+        if last_state is not None:
+            self.last_flags[unit] = last_state[0]
+            self._load_sensors(unit, last_state[1], last=True)
+
+    def controller(self, unit: int) -> SplitSystemController:
+        controller = SplitSystemController(self._modes)
+        controller.restore(self.snapshot(unit))
+        return controller
+
+    def info(self, unit: int) -> str:
+        flags = int(self.flags[unit])
+        temperature, fan_speed, humidity = self._sensors(unit)
+        return json.dumps({"mode": self._mode_names[self.mode[unit]],
+                           "is_locked": bool(self.locked[unit]),
+                           "turbo_mode": bool(self.turbo[unit]),
+                           "ventilation": {
+                               'ventilation_on': bool(flags & VENTILATION_ON),
+                               'conditioner_on': bool(flags & CONDITIONER_ON),
+                               'humidifier_on': bool(flags & HUMIDIFIER_ON),
+                               'led_display': bool(flags & LED_DISPLAY),
+                               'sensors': {'temperature': temperature, 'fan_speed': fan_speed,
+                                           'humidity': humidity}}})
+
+    def state_record(self, unit: int) -> bytes:
+        return pack_state_record(int(self.mode[unit]), bool(self.locked[unit]), bool(self.turbo[unit]),
+                                 int(self.flags[unit]), self._sensors(unit))
+
+    def state_digest(self, unit: int) -> int:
+        return int.from_bytes(hashlib.blake2b(self.state_record(unit), digest_size=8).digest(), "little")
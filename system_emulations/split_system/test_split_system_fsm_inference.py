@@ -1,7 +1,10 @@
 from aalpy import run_non_det_Lstar
 from aalpy.oracles import RandomWalkEqOracle
-from aalpy.learning_algs import run_Lstar
 
+from system_emulations.alphabet_reduction import run_reduced_Lstar
+from system_emulations.coverage_oracle import CoverageGuidedEqOracle
+from system_emulations.parallel_queries import ParallelSUL, BatchRandomWalkEqOracle, run_parallel_Lstar
+from system_emulations.query_cache import CachingSUL
 from system_emulations.test_locators import PATH_TO_RESULTS_DIR
 from system_emulations.test_sul import HVACSystemSUL
 
@@ -9,20 +12,32 @@ from system_emulations.test_sul import HVACSystemSUL
 def main():
     alphabet = ['l', 'ld', 'Mc', 'Mh', 'Mf', 'Md', 'SMt', 'SF', 'SH', 'ST',
                 's3', 's2', 's1', 's0', 'r']
-    sul = HVACSystemSUL()
-    eq_oracle = RandomWalkEqOracle(alphabet=alphabet, sul=sul, num_steps=1000,
-                                   reset_prob=0.1)
-    learned_model = run_Lstar(alphabet=alphabet, sul=sul, eq_oracle=eq_oracle,
-                              automaton_type='dfa')
-    learned_model.save(PATH_TO_RESULTS_DIR + "HVAC_L_dfa")
+    cache_path = PATH_TO_RESULTS_DIR.joinpath("HVAC_queries.cache")
+    sul = CachingSUL.from_file(HVACSystemSUL(), cache_path)
+    eq_oracle = CoverageGuidedEqOracle(alphabet=alphabet, sul=sul, num_steps=5000,
+                                       reset_prob=0.02)
+    learned_model = run_reduced_Lstar(alphabet=alphabet, sul=sul, eq_oracle=eq_oracle,
+                                      automaton_type='dfa')
+    learned_model.save(PATH_TO_RESULTS_DIR.joinpath("HVAC_L_dfa"))
 
-    sul = HVACSystemSUL()
+    sul = CachingSUL(HVACSystemSUL(), sul.cache)
     eq_oracle = RandomWalkEqOracle(alphabet=alphabet, sul=sul, num_steps=1000,
                                    reset_prob=0.1)
     learned_model = run_non_det_Lstar(alphabet=alphabet, sul=sul,
                                       eq_oracle=eq_oracle)
-    learned_model.save(PATH_TO_RESULTS_DIR + "HVAC_non_det_L")
+    learned_model.save(PATH_TO_RESULTS_DIR.joinpath("HVAC_non_det_L"))
+    sul.save(cache_path)
+
+    sul = ParallelSUL(HVACSystemSUL)
+    eq_oracle = BatchRandomWalkEqOracle(alphabet=alphabet, sul=sul, num_steps=5000,
+                                        reset_prob=0.09)
+    learned_model = run_parallel_Lstar(alphabet=alphabet, sul=sul, eq_oracle=eq_oracle,
+                                       automaton_type='mealy')
+    sul.close()
+    learned_model.save(PATH_TO_RESULTS_DIR.joinpath("HVAC_L_mealy"))
 
 
 if __name__ == "__main__":
+    if not PATH_TO_RESULTS_DIR.exists():
+        PATH_TO_RESULTS_DIR.mkdir(parents=True)
     main()
\ No newline at end of file
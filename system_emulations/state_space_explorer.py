@@ -0,0 +1,145 @@
+from multiprocessing import Pool
+
+from aalpy.automata import MealyMachine, MealyState, MooreMachine, MooreState
+
+_worker_sul = None
+
+
+def _init_worker(sul_class):
+    global _worker_sul
+    _worker_sul = sul_class()
+
+
+def _expand(sul, state: tuple, alphabet: list) -> list:
+    transitions = []
+    for letter in alphabet:
+        sul.restore_state(state)
+        output = sul.step(letter)
+        transitions.append((letter, output, sul.save_state()))
+    return transitions
+
+
+def _expand_chunk(args: tuple) -> list:
+    states, alphabet = args
+    return [_expand(_worker_sul, state, alphabet) for state in states]
+
+
+class StateSpaceExplorer:
+    def __init__(self, sul_class, alphabet: list, automaton_type: str = 'mealy',
+                 max_states: int | None = None, hashed_states: bool = False,
+                 processes: int | None = 1, chunk_size: int = 256):
+        if automaton_type not in ('mealy', 'moore'):
+            raise ValueError('automaton type must be either "mealy" or "moore"')
+        self.sul_class = sul_class
+        self.alphabet = alphabet
+        self.automaton_type = automaton_type
+        self.max_states = max_states
+        # keep only 64-bit hashes of visited states instead of the states themselves
+        self.hashed_states = hashed_states
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.complete = False
+
+    def _key(self, state: tuple, output):
+        key = (state, output) if self.automaton_type == 'moore' else state
+        return hash(key) if self.hashed_states else key
+
+    def _expand_level(self, sul, pool, frontier: list) -> list:
+        if pool is None:
+            return [_expand(sul, state, self.alphabet) for state in frontier]
+        chunks = [(frontier[i:i + self.chunk_size], self.alphabet)
+                  for i in range(0, len(frontier), self.chunk_size)]
+        return [transitions for chunk in pool.map(_expand_chunk, chunks) for transitions in chunk]
+
+    def explore(self, minimize: bool = False):
+        sul = self.sul_class()
+        sul.pre()
+        initial_state = sul.save_state()
+        initial_output = sul.step(None) if self.automaton_type == 'moore' else None
+
+        # visited: key -> state id; edges: (source id, letter, output, target id)
+        visited = {self._key(initial_state, initial_output): 0}
+        outputs = [initial_output]
+        edges = []
+        frontier = [(0, initial_state)]
+        self.complete = True
+
+        pool = Pool(self.processes, initializer=_init_worker, initargs=(self.sul_class,)) \
+            if self.processes != 1 else None
+        try:
+            while frontier:
+                level = self._expand_level(sul, pool, [state for _, state in frontier])
+                next_frontier = []
+                for (source, _), transitions in zip(frontier, level):
+                    for letter, output, state in transitions:
+                        key = self._key(state, output)
+                        target = visited.get(key)
+                        if target is None:
+                            if self.max_states is not None and len(visited) >= self.max_states:
+                                self.complete = False
+                                continue
+                            target = visited[key] = len(visited)
+                            outputs.append(output)
+                            next_frontier.append((target, state))
+                        edges.append((source, letter, output, target))
+                frontier = next_frontier
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if minimize:
+            outputs, edges = self._minimize(outputs, edges)
+        return self._build_automaton(outputs, edges)
+
+    def _minimize(self, outputs: list, edges: list) -> tuple:
+        # partition refinement over the explored graph
+        successors = [{} for _ in outputs]
+        for source, letter, output, target in edges:
+            successors[source][letter] = (output, target)
+        if self.automaton_type == 'moore':
+            signatures = [(output,) for output in outputs]
+        else:
+            signatures = [tuple(successors[i].get(letter, (None,))[0] for letter in self.alphabet)
+                          for i in range(len(outputs))]
+
+        blocks_count = 0
+        while True:
+            block_ids = {}
+            block = [block_ids.setdefault(signature, len(block_ids)) for signature in signatures]
+            if len(block_ids) == blocks_count:
+                break
+            blocks_count = len(block_ids)
+            signatures = [(block[i],) + tuple(
+                block[successors[i][letter][1]] if letter in successors[i] else None
+                for letter in self.alphabet) for i in range(len(outputs))]
+
+        # block of the initial state becomes the new initial state
+        order = {block[0]: 0}
+        for b in block:
+            order.setdefault(b, len(order))
+        minimal_outputs = [None] * blocks_count
+        minimal_edges = {}
+        for i, output in enumerate(outputs):
+            minimal_outputs[order[block[i]]] = output
+        for source, letter, output, target in edges:
+            minimal_edges[(order[block[source]], letter)] = (output, order[block[target]])
+        return minimal_outputs, [(source, letter, output, target)
+                                 for (source, letter), (output, target) in minimal_edges.items()]
+
+    def _build_automaton(self, outputs: list, edges: list):
+        if self.automaton_type == 'mealy':
+            states = [MealyState(f's{i}') for i in range(len(outputs))]
+            for source, letter, output, target in edges:
+                states[source].transitions[letter] = states[target]
+                states[source].output_fun[letter] = output
+            return MealyMachine(states[0], states)
+
+        states = [MooreState(f's{i}', output) for i, output in enumerate(outputs)]
+        for source, letter, _, target in edges:
+            states[source].transitions[letter] = states[target]
+        return MooreMachine(states[0], states)
+
+
+def build_reference_model(sul_class, alphabet: list, automaton_type: str = 'mealy',
+                          minimize: bool = True, **kwargs):
+    return StateSpaceExplorer(sul_class, alphabet, automaton_type, **kwargs).explore(minimize)
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import itertools
+import json
+import socket
+import struct
+
+from aalpy.base import SUL
+
+from system_emulations.pump_transfer_system.pumps_controller import PumpsController, pumps_system_command_handler
+from system_emulations.pump_transfer_system.pumps_mapper import PumpsMapper
+from system_emulations.reservoir_filling_system.reservoir_controller import ReservoirSystem, \
+    reservoir_system_command_handler
+from system_emulations.split_system.split_system_controller import SplitSystemController, \
+    split_system_command_handler
+
+# every frame is a 4-byte big-endian payload length followed by a JSON payload
+HEADER = struct.Struct("!I")
+# the largest request payload the server reads, a pipelined batch of 256 long queries fits many times
+MAX_FRAME_SIZE = 16 << 20
+
+
+def encode_frame(message: dict) -> bytes:
+    payload = json.dumps(message, separators=(',', ':')).encode()
+    return HEADER.pack(len(payload)) + payload
+
+
+SYSTEMS = {
+    "reservoir": (ReservoirSystem, lambda system, command: reservoir_system_command_handler(system, *command)),
+    "hvac": (SplitSystemController, lambda system, command: split_system_command_handler(system, *command)),
+    "pumps": (PumpsController, lambda system, command: pumps_system_command_handler(system, *command)),
+}
+
+
+class Session:
+    def __init__(self, system_name: str, auto_tick: bool = False):
+        system_class, self.handler = SYSTEMS[system_name]
+        self.system = system_class()
+        self.initial_state = self.system.snapshot()
+        self.auto_tick = auto_tick and hasattr(self.system, "update")
+
+    def run(self, commands: list, reset: bool = False, tick: bool = False) -> list:
+        if reset:
+            self.system.restore(self.initial_state)
+        results = [self.handler(self.system, command) for command in commands]
+        if tick:
+            self.system.update()
+        return results
+
+
+class SULServer:
+    def __init__(self, tick_interval: float | None = None, max_frame_size: int = MAX_FRAME_SIZE):
+        self.sessions = {}
+        self._session_ids = itertools.count()
+        self.tick_interval = tick_interval
+        self.max_frame_size = max_frame_size
+
+    def handle_request(self, request: dict) -> dict:
+        op = request.get("op")
+        try:
+            match op:
+                case "open":
+                    session_id = next(self._session_ids)
+                    self.sessions[session_id] = Session(request["system"], request.get("auto_tick", False))
+                    return {"session": session_id}
+                case "batch":
+                    session = self.sessions[request["session"]]
+                    return {"results": session.run(request["commands"], request.get("reset", False),
+                                                   request.get("tick", False))}
+                case "queries":
+                    # several reset-run-tick queries in one frame
+                    session = self.sessions[request["session"]]
+                    return {"results": [session.run(commands, True, request.get("tick", False))
+                                        for commands in request["words"]]}
+                case "close":
+                    self.sessions.pop(request["session"], None)
+                    return {}
+                case _:
+                    return {"error": f"unknown op {op}"}
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        opened = []
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                size = HEADER.unpack(header)[0]
+                if size > self.max_frame_size:
+                    # the payload is not read, the stream cannot be followed any further
+                    writer.write(encode_frame({"error": f"frame of {size} bytes exceeds the maximum "
+                                                        f"of {self.max_frame_size} bytes"}))
+                    await writer.drain()
+                    break
+                request = json.loads(await reader.readexactly(size))
+                response = self.handle_request(request)
+                response["id"] = request.get("id")
+                if request.get("op") == "open" and "session" in response:
+                    opened.append(response["session"])
+                writer.write(encode_frame(response))
+                # pipelined requests are answered without waiting for the socket to drain
+                if writer.transport.get_write_buffer_size() > 1 << 20:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for session_id in opened:
+                self.sessions.pop(session_id, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def tick(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            for session in list(self.sessions.values()):
+                if session.auto_tick:
+                    session.system.update()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, path: str | None = None):
+        if path:
+            server = await asyncio.start_unix_server(self.handle_connection, path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        tasks = [asyncio.create_task(self.tick())] if self.tick_interval else []
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class SULClient:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, path: str | None = None):
+        if path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self.socket.makefile("rb")
+        self._request_ids = itertools.count()
+
+    def send(self, request: dict) -> int:
+        request["id"] = next(self._request_ids)
+        self.socket.sendall(encode_frame(request))
+        return request["id"]
+
+    def receive(self) -> dict:
+        header = self._file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ConnectionError("connection closed by the server")
+        response = json.loads(self._file.read(HEADER.unpack(header)[0]))
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def request(self, request: dict) -> dict:
+        self.send(request)
+        return self.receive()
+
+    def pipeline(self, requests: list) -> list:
+        for request in requests:
+            self.send(request)
+        return [self.receive() for _ in requests]
+
+    def close(self):
+        self._file.close()
+        self.socket.close()
+
+
+class RemoteSUL(SUL):
+    def __init__(self, system: str, client: SULClient, mapper: PumpsMapper | None = None):
+        super().__init__()
+        self.system = system
+        self.client = client
+        self.mapper = mapper if mapper is not None or system != "pumps" else PumpsMapper()
+        self.session = client.request({"op": "open", "system": system})["session"]
+        self._reset = True
+
+    def _command(self, letter) -> list:
+        if self.system == "hvac":
+            return [letter if letter else 'r']
+        if self.system == "pumps":
+            return list(self.mapper.concretize(letter) or (0, None, None))
+        return [letter]
+
+    def _output(self, output):
+        return self.mapper.abstract(output) if self.mapper is not None else output
+
+    def pre(self):
+        self._reset = True
+        if self.mapper is not None:
+            self.mapper.reset()
+
+    def step(self, letter):
+        response = self.client.request({"op": "batch", "session": self.session,
+                                        "commands": [self._command(letter)], "reset": self._reset})
+        self._reset = False
+        return self._output(response["results"][0])
+
+    def post(self):
+        if self.system == "pumps" and not self._reset:
+            self.client.request({"op": "batch", "session": self.session, "commands": [], "tick": True})
+
+    def _encode_word(self, word) -> list:
+        if self.mapper is not None:
+            self.mapper.reset()
+        return [self._command(letter) for letter in (word if len(word) else (None,))]
+
+    def query(self, word: tuple) -> list:
+        return self.query_batch([word])[0]
+
+    def query_batch(self, words: list, batch_size: int = 256) -> list:
+        requests = [{"op": "queries", "session": self.session, "tick": self.system == "pumps",
+                     "words": [self._encode_word(word) for word in words[i:i + batch_size]]}
+                    for i in range(0, len(words), batch_size)]
+        outputs = [[self._output(output) for output in results]
+                   for response in self.client.pipeline(requests) for results in response["results"]]
+        self.num_queries += len(words)
+        self.num_steps += sum(len(word) for word in words)
+        return outputs
+
+    def close(self):
+        self.client.request({"op": "close", "session": self.session})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None)
+    parser.add_argument("--tick-hz", type=float, default=0)
+    parser.add_argument("--max-frame-size", type=int, default=MAX_FRAME_SIZE)
+    args = parser.parse_args()
+
+    server = SULServer(1 / args.tick_hz if args.tick_hz else None, args.max_frame_size)
+    asyncio.run(server.serve(args.host, args.port, args.unix))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import random
+
+from aalpy.utils import generate_random_deterministic_automata
+
+from system_emulations.compiled_model import CompiledModel, CompiledModelSUL
+from system_emulations.state_space_explorer import build_reference_model
+from system_emulations.test_sul import SYSTEMS
+
+
+def reference_models() -> list:
+    models = [(f"{name} {automaton_type}", build_reference_model(SYSTEMS[name][0], SYSTEMS[name][1], automaton_type))
+              for name, automaton_type in (("reservoir", 'mealy'), ("reservoir", 'moore'), ("pumps", 'mealy'),
+                                           ("hvac", 'mealy'))]
+    for seed, automaton_type in enumerate(('mealy', 'moore', 'dfa')):
+        random.seed(seed)
+        models.append((f"random {automaton_type}",
+                       generate_random_deterministic_automata(automaton_type, 40, 6, 5)))
+    return models
+
+
+def random_words(rng: random.Random, alphabet: list, count: int, max_length: int) -> list:
+    return [tuple(rng.choice(alphabet) for _ in range(rng.randint(0, max_length))) for _ in range(count)]
+
+
+def compare_execution(model, runs: int, seed: int = 0) -> None:
+    # batches of words of mixed lengths, the SUL stepping one letter at a time and random walks
+    # all give the outputs of the automaton itself
+    rng = random.Random(seed)
+    compiled = CompiledModel.from_automaton(model)
+    alphabet = model.get_input_alphabet()
+    words = random_words(rng, alphabet, runs, 30)
+    expected = [model.execute_sequence(model.initial_state, word) for word in words]
+    assert compiled.execute_batch(words) == expected
+    assert compiled.execute_batch(words[:1]) == expected[:1]
+    assert compiled.execute_batch([]) == []
+
+    sul = CompiledModelSUL(compiled)
+    for word, outputs in zip(words, expected):
+        if word:
+            assert sul.query(word) == outputs, word
+    assert sul.query_batch(words) == expected
+
+    encoded, output_codes = compiled.random_walks(runs, 20, seed)
+    for letters, codes in zip(encoded.tolist(), output_codes.tolist()):
+        word = [compiled.inputs[code] for code in letters]
+        assert [compiled.outputs[code] for code in codes] == model.execute_sequence(model.initial_state, word)
+
+
+def check_missing_transition(model) -> None:
+    # a word that takes a missing transition is refused, not answered from padding
+    compiled = CompiledModel.from_automaton(model)
+    letter = model.get_input_alphabet()[0]
+    compiled.transitions[compiled.initial_state, compiled.input_codes[letter]] = -1
+    compiled = CompiledModel(compiled.automaton_type, compiled.inputs, compiled.outputs, compiled.transitions,
+                             compiled.output_table, compiled.initial_state)
+    assert not compiled.complete
+    try:
+        compiled.execute_batch([(letter,)])
+        raise AssertionError("a missing transition was taken")
+    except ValueError:
+        pass
+
+
+def main():
+    for seed, (name, model) in enumerate(reference_models()):
+        compare_execution(model, runs=500, seed=seed)
+        print(f"{name} ({len(model.states)} states): compiled execution matches the automaton")
+    check_missing_transition(reference_models()[0][1])
+    print("missing transitions are refused")
+
+
+if __name__ == "__main__":
+    main()
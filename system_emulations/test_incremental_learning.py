@@ -0,0 +1,127 @@
+import argparse
+import random
+import tempfile
+from pathlib import Path
+
+from aalpy.learning_algs import run_Lstar
+from aalpy.oracles import RandomWalkEqOracle
+from aalpy.utils import bisimilar
+
+from system_emulations.incremental_learning import relearn
+from system_emulations.query_cache import CachingSUL
+from system_emulations.state_space_explorer import build_reference_model
+from system_emulations.test_sul import SYSTEMS, HVACSystemSUL, MicrofluidicSystemSUL
+
+
+class OverflowMicrofluidicSystemSUL(MicrofluidicSystemSUL):
+    # a later version of the system: filling a full reservoir twice in a row reports an overflow
+    def pre(self):
+        super().pre()
+        self.attempts = 0
+
+    def step(self, command):
+        response = super().step(command)
+        if command == 'fill' and response == "The reservoir is already full":
+            self.attempts += 1
+            if self.attempts == 2:
+                self.attempts = 0
+                return "The reservoir overflows"
+        else:
+            self.attempts = 0
+        return response
+
+    def save_state(self) -> tuple:
+        return super().save_state(), self.attempts
+
+    def restore_state(self, state: tuple) -> None:
+        system_state, self.attempts = state
+        super().restore_state(system_state)
+
+
+class ServiceModeHVACSystemSUL(HVACSystemSUL):
+    # a later version of the system: pressing ld twice on a locked system enters a service mode
+    def pre(self):
+        super().pre()
+        self.presses = 0
+
+    def step(self, command):
+        response = super().step(command)
+        if command == 'ld' and response == "ERR System is locked.":
+            self.presses += 1
+            if self.presses == 2:
+                self.presses = 0
+                return "OK Service mode."
+        else:
+            self.presses = 0
+        return response
+
+    def save_state(self) -> tuple:
+        return super().save_state(), self.presses
+
+    def restore_state(self, state: tuple) -> None:
+        system_state, self.presses = state
+        super().restore_state(system_state)
+
+
+def check_relearn(model_path: Path, sul, alphabet: list, automaton_type: str, expected, num_steps: int) -> None:
+    random.seed(1)
+    eq_oracle = RandomWalkEqOracle(alphabet, sul, num_steps=num_steps, reset_prob=0.02)
+    model = relearn(model_path, alphabet, sul, eq_oracle, automaton_type, print_level=0)
+    assert bisimilar(model, expected), (len(model.states), len(expected.states))
+
+
+# system: (SUL of the saved model, SUL of the changed system, random walk steps per equivalence query)
+CHANGED_SYSTEMS = {
+    "reservoir": (MicrofluidicSystemSUL, OverflowMicrofluidicSystemSUL, 2000),
+    "hvac": (HVACSystemSUL, ServiceModeHVACSystemSUL, 20000),
+}
+
+
+def check_system(name: str, directory: str) -> None:
+    sul_class, changed_sul_class, num_steps = CHANGED_SYSTEMS[name]
+    _, alphabet = SYSTEMS[name]
+    for automaton_type in ('mealy', 'moore'):
+        model_path = Path(directory).joinpath(f"{name}_L_{automaton_type}")
+        saved_model = build_reference_model(sul_class, alphabet, automaton_type)
+        saved_model.save(model_path)
+        changed_model = build_reference_model(changed_sul_class, alphabet, automaton_type)
+        assert len(changed_model.states) > len(saved_model.states)
+
+        check_relearn(model_path, sul_class(), alphabet, automaton_type, saved_model, num_steps)
+        check_relearn(model_path, changed_sul_class(), alphabet, automaton_type, changed_model, num_steps)
+        # behind a persisted cache filled by the old system
+        cache_path = Path(directory).joinpath(f"{name}_queries.cache")
+        sul = CachingSUL(sul_class())
+        run_Lstar(alphabet, sul, RandomWalkEqOracle(alphabet, sul, num_steps=num_steps // 4), automaton_type,
+                  print_level=0)
+        sul.save(cache_path)
+        check_relearn(model_path, CachingSUL.from_file(sul_class(), cache_path), alphabet,
+                      automaton_type, saved_model, num_steps)
+        check_relearn(model_path, CachingSUL.from_file(changed_sul_class(), cache_path), alphabet,
+                      automaton_type, changed_model, num_steps)
+        print(f"{name} {automaton_type}: the saved {len(saved_model.states)}-state model was repaired into "
+              f"the {len(changed_model.states)}-state model of the changed system")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # the HVAC models have hundreds to thousands of states, repairing them takes several minutes
+    parser.add_argument("--hvac", action="store_true", help="also repair the HVAC models")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        check_system("reservoir", directory)
+        if args.hvac:
+            check_system("hvac", directory)
+
+        _, alphabet = SYSTEMS["reservoir"]
+        try:
+            relearn(Path(directory).joinpath("reservoir_L_dfa"), alphabet, MicrofluidicSystemSUL(), None, 'dfa')
+        except ValueError:
+            print("dfa is rejected")
+        else:
+            raise AssertionError("dfa models cannot be compared with the SUL")
+
+
+if __name__ == "__main__":
+    main()
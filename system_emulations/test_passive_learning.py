@@ -0,0 +1,66 @@
+import random
+import tempfile
+from pathlib import Path
+
+from aalpy.utils import bisimilar
+
+from system_emulations.passive_learning import learn_from_traces, io_traces_from_log
+from system_emulations.state_space_explorer import build_reference_model
+from system_emulations.test_sul import SYSTEMS, HVACSystemSUL
+from system_emulations.trace_log import TraceRecorder
+
+
+def characteristic_words(model, alphabet: list) -> list:
+    # every state reached by its shortest access word, left by every letter and told apart
+    # by the characterization set: enough for RPNI to find the model, whatever else is in the data
+    model.compute_prefixes()
+    suffixes = model.compute_characterization_set(raise_warning=False)
+    return [tuple(state.prefix) + middle + tuple(suffix)
+            for state in model.states
+            for middle in [()] + [(letter,) for letter in alphabet]
+            for suffix in suffixes]
+
+
+def random_words(rng: random.Random, alphabet: list, count: int, max_length: int) -> list:
+    return [tuple(rng.choice(alphabet) for _ in range(rng.randint(1, max_length))) for _ in range(count)]
+
+
+def record_traces(words: list, sul) -> list:
+    traces = []
+    for word in words:
+        sul.pre()
+        traces.append([(letter, sul.step(letter)) for letter in word])
+    return traces
+
+
+def record_log(path: Path, words: list) -> None:
+    # one session per word, each on a fresh controller
+    with TraceRecorder(path) as recorder:
+        for session, word in enumerate(words):
+            handler = recorder.wrap("hvac", session)
+            system = HVACSystemSUL().system
+            for letter in word:
+                handler(system, letter)
+
+
+def main():
+    _, alphabet = SYSTEMS["hvac"]
+    reference = build_reference_model(HVACSystemSUL, alphabet)
+    words = characteristic_words(reference, alphabet)
+    # the random words only add data, they must not lead RPNI to other merges
+    words += random_words(random.Random(1), alphabet, 5000, 50)
+
+    model = learn_from_traces(record_traces(words, HVACSystemSUL()))
+    assert bisimilar(model, reference), (len(model.states), len(reference.states))
+    print(f"{len(words)} traces: learned the {len(reference.states)}-state reference model")
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = Path(directory).joinpath("hvac.trace")
+        record_log(log_path, words)
+        model = learn_from_traces(io_traces_from_log(log_path, "hvac"))
+        assert bisimilar(model, reference), (len(model.states), len(reference.states))
+        print("the same traces through a trace log: learned the reference model")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import random
+import tempfile
+from pathlib import Path
+
+from system_emulations.query_cache import CachingSUL, QueryTrie
+from system_emulations.test_sul import SYSTEMS
+
+
+def random_words(rng: random.Random, alphabet: list, count: int, max_length: int) -> list:
+    return [tuple(rng.choice(alphabet) for _ in range(rng.randint(0, max_length))) for _ in range(count)]
+
+
+def compare_cache(name: str, runs: int, seed: int = 0) -> None:
+    # answers from the cache, fresh or saved and loaded, match a live SUL word by word,
+    # also for words that leave the cache halfway through
+    sul_class, alphabet = SYSTEMS[name]
+    rng = random.Random(seed)
+    words = random_words(rng, alphabet, runs, 12)
+    live = sul_class()
+    expected = [live.query(word) for word in words]
+
+    cached = CachingSUL(sul_class())
+    for word, outputs in zip(words, expected):
+        assert cached.query(word) == outputs, word
+    # the second time every word is a cache hit
+    steps = cached.sul.num_steps
+    for word, outputs in zip(words, expected):
+        assert cached.query(word) == outputs, word
+    assert cached.sul.num_steps == steps
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = Path(directory).joinpath(f"{name}_queries.cache")
+        cached.save(cache_path)
+        loaded = CachingSUL.from_file(sul_class(), cache_path)
+        assert len(loaded.cache) == len(cached.cache)
+        for word, outputs in zip(words, expected):
+            assert loaded.query(word) == outputs, word
+        assert loaded.sul.num_steps == 0
+        for word in random_words(rng, alphabet, runs, 12):
+            extended = word + tuple(rng.choice(alphabet) for _ in range(rng.randint(1, 4)))
+            assert loaded.query(extended) == live.query(extended), extended
+
+
+def compare_stored_symbols() -> None:
+    # the values a cache file can hold come back with their types
+    trie = QueryTrie()
+    trie.fingerprint = "symbols"
+    words = [(None,), ('a', 1, 1.5), (True, ('t', (2,))), (False, 0, -2 ** 70)]
+    outputs = [("ok",), (0, 'b', None), (1, True), (('x', 1.0), False, 'c')]
+    for word, output in zip(words, outputs):
+        trie.insert(word, output)
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = Path(directory).joinpath("symbols.cache")
+        trie.save(cache_path)
+        loaded = QueryTrie.load(cache_path)
+        assert loaded.fingerprint == trie.fingerprint
+        for word, output in zip(words, outputs):
+            assert loaded.lookup(word) == list(output), word
+            assert [type(value) for value in loaded.lookup(word)] == [type(value) for value in output], word
+
+        # anything other than a cache of this version is an empty cache
+        cache_path.write_bytes(b"not a cache")
+        assert len(QueryTrie.load(cache_path)) == 0
+
+
+def main():
+    for seed, name in enumerate(SYSTEMS):
+        compare_cache(name, runs=300, seed=seed)
+        print(f"{name}: cached answers match the live SUL, before and after saving")
+    compare_stored_symbols()
+    print("stored letters and outputs keep their types")
+
+
+if __name__ == "__main__":
+    main()
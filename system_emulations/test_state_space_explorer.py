@@ -0,0 +1,29 @@
+from functools import partial
+
+from system_emulations.pump_transfer_system.pumps_mapper import PumpsMapper
+from system_emulations.state_space_explorer import StateSpaceExplorer
+from system_emulations.test_sul import SYSTEMS, PumpsSystemSUL
+
+# a seeded mapper draws new values on every step, its state never repeats and the
+# exploration would not end, the unseeded one always maps a letter to the same command
+REFERENCE_SULS = {
+    "pumps": partial(PumpsSystemSUL, PumpsMapper(seed=None)),
+}
+# minimal Mealy models, a reservoir state only matters up to rotating the fill flags to the
+# connected reservoir: 2 ** 3 of them and the state before the first 'next'
+EXPECTED_STATES = {"reservoir": 9, "pumps": 1, "hvac": 320}
+
+
+def main():
+    for name, (sul_class, alphabet) in SYSTEMS.items():
+        for processes in (1, 2):
+            explorer = StateSpaceExplorer(REFERENCE_SULS.get(name, sul_class), alphabet,
+                                          processes=processes)
+            model = explorer.explore(minimize=True)
+            assert explorer.complete, name
+            assert len(model.states) == EXPECTED_STATES[name], (name, len(model.states))
+            print(f"{name}: {len(model.states)} states with {processes} process(es)")
+
+
+if __name__ == "__main__":
+    main()
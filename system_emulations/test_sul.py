@@ -1,76 +1,107 @@
-from aalpy.base import SUL
-from system_emulations.split_system.split_system_controller import SplitSystemController, split_system_command_handler
-from system_emulations.reservoir_filling_system.reservoir_controller import ReservoirSystem, reservoir_system_command_handler
-from system_emulations.pump_transfer_system.pumps_controller import \
-    PumpsController, pumps_system_command_handler
-from random import seed, randint
-
-seed()
-
-class MicrofluidicSystemSUL(SUL):
-    def __init__(self):
-        super().__init__()
-        self.microfluidic_system = None
-
-    def pre(self):
-        self.microfluidic_system = ReservoirSystem()
-
-    def step(self, command):
-        return reservoir_system_command_handler(self.microfluidic_system, command)
-
-    def post(self):
-        pass
-
-
-class HVACSystemSUL(SUL):
-    def __init__(self):
-        super().__init__()
-        self.hvac_system = SplitSystemController()
-
-    def pre(self):
-        split_system_command_handler(self.hvac_system, 'r')
-
-    def step(self, command):
-        response = split_system_command_handler(self.hvac_system, command) if command else split_system_command_handler(self.hvac_system, 'r')
-        return response
-
-    def post(self):
-        pass
-
-
-class PumpsSystemSUL(SUL):
-    def __init__(self):
-        super().__init__()
-        self.system = None
-
-    def pre(self):
-        self.system = PumpsController()
-
-    def step(self, letter):
-        _id = randint(0, 3)
-        valid_value = randint(0, 100)
-        invalid_value = randint(101, 1000)
-        match letter:
-            case "change flow speed from 1 to 100":
-                return pumps_system_command_handler(self.system, _id, '-f', valid_value)
-            case "change flow speed from -100 to -1":
-                return pumps_system_command_handler(self.system, _id, '-f', -valid_value)
-            case "change flow speed from 101 to inf":
-                return pumps_system_command_handler(self.system, _id, '-f', invalid_value)
-            case "change flow speed from -inf to -101":
-                return pumps_system_command_handler(self.system, _id, '-f', -invalid_value)
-            case "change flow speed zero":
-                return pumps_system_command_handler(self.system, _id, '-f', 0)
-            case "change mode sync":
-                return pumps_system_command_handler(self.system, _id, '-m', 'sync')
-            case "change mode async":
-                return pumps_system_command_handler(self.system, _id, '-m', 'async')
-            case "turn on":
-                return pumps_system_command_handler(self.system, _id, '-s', True)
-            case "turn off":
-                return pumps_system_command_handler(self.system, _id, '-s', False)
-            case _:
-                return "Unknown command"
-
-    def post(self):
-        self.system.update()
+import hashlib
+import inspect
+from pathlib import Path
+
+from aalpy.base import SUL
+from system_emulations.split_system.split_system_controller import SplitSystemController, split_system_command_handler
+from system_emulations.reservoir_filling_system.reservoir_controller import ReservoirSystem, reservoir_system_command_handler
+from system_emulations.pump_transfer_system.pumps_controller import \
+    PumpsController, pumps_system_command_handler
+from system_emulations.pump_transfer_system.pumps_mapper import PumpsMapper
+
+
+class SnapshotSUL(SUL):
+    def __init__(self, system):
+        super().__init__()
+        self.system = system
+        self._initial_state = system.snapshot()
+
+    def pre(self):
+        self.system.restore(self._initial_state)
+
+    def post(self):
+        pass
+
+    def save_state(self) -> tuple:
+        return self.system.snapshot()
+
+    def restore_state(self, state: tuple) -> None:
+        self.system.restore(state)
+
+    def fingerprint(self, config=(), classes=()) -> str:
+        # the code of the SUL and its system, their configuration and the initial state
+        digest = hashlib.blake2b(repr((self._initial_state, config)).encode(), digest_size=16)
+        for cls in (type(self), type(self.system), *classes):
+            digest.update(f"{cls.__module__}.{cls.__qualname__}".encode())
+            digest.update(Path(inspect.getfile(cls)).read_bytes())
+        return digest.hexdigest()
+
+    def query_from(self, state: tuple, word: tuple) -> list:
+        self.restore_state(state)
+        out = [self.step(letter) for letter in word]
+        self.post()
+        self.num_queries += 1
+        self.num_steps += len(word)
+        return out
+
+
+class MicrofluidicSystemSUL(SnapshotSUL):
+    def __init__(self):
+        super().__init__(ReservoirSystem())
+
+    def step(self, command):
+        return reservoir_system_command_handler(self.system, command)
+
+
+class HVACSystemSUL(SnapshotSUL):
+    def __init__(self):
+        super().__init__(SplitSystemController())
+
+    def step(self, command):
+        response = split_system_command_handler(self.system, command) if command else split_system_command_handler(self.system, 'r')
+        return response
+
+    def fingerprint(self, config=(), classes=()) -> str:
+        return super().fingerprint((dict(self.system.get_modes()), config), classes)
+
+
+class PumpsSystemSUL(SnapshotSUL):
+    def __init__(self, mapper: PumpsMapper | None = None):
+        super().__init__(PumpsController())
+        self.mapper = mapper if mapper is not None else PumpsMapper()
+
+    def pre(self):
+        super().pre()
+        self.mapper.reset()
+
+    def save_state(self) -> tuple:
+        return super().save_state(), self.mapper.get_state()
+
+    def restore_state(self, state: tuple) -> None:
+        system_state, mapper_state = state
+        super().restore_state(system_state)
+        self.mapper.set_state(mapper_state)
+
+    def step(self, letter):
+        command = self.mapper.concretize(letter)
+        if command is None:
+            return self.mapper.abstract("Unknown command")
+        return self.mapper.abstract(pumps_system_command_handler(self.system, *command))
+
+    def post(self):
+        self.system.update()
+
+    def fingerprint(self, config=(), classes=()) -> str:
+        return super().fingerprint((self.mapper.seed, self.mapper.pumps_num, config), (type(self.mapper), *classes))
+
+
+# the SULs by name with their learning alphabets
+SYSTEMS = {
+    "reservoir": (MicrofluidicSystemSUL, ['fill', 'next', 'empty']),
+    "pumps": (PumpsSystemSUL, ["change flow speed from 1 to 100", "change flow speed from -100 to -1",
+                               "change flow speed from 101 to inf", "change flow speed from -inf to -101",
+                               'change flow speed zero', 'change mode sync',
+                               'change mode async', 'turn on', 'turn off']),
+    "hvac": (HVACSystemSUL, ['l', 'ld', 'Mc', 'Mh', 'Mf', 'Md', 'SMt', 'SF', 'SH', 'ST',
+                             's3', 's2', 's1', 's0', 'r']),
+}
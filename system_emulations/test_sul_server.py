@@ -0,0 +1,87 @@
+import asyncio
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from system_emulations.sul_server import SULServer, SULClient, RemoteSUL, HEADER
+from system_emulations.test_sul import SYSTEMS
+
+
+def start_server(path: str, max_frame_size: int) -> SULServer:
+    server = SULServer(max_frame_size=max_frame_size)
+    threading.Thread(target=asyncio.run, args=(server.serve(path=path),), daemon=True).start()
+    while not Path(path).exists():
+        time.sleep(0.01)
+    return server
+
+
+def random_words(rng: random.Random, alphabet: list, count: int, max_length: int) -> list:
+    return [tuple(rng.choice(alphabet) for _ in range(rng.randint(0, max_length))) for _ in range(count)]
+
+
+def compare_remote(path: str, name: str, runs: int, seed: int = 0) -> None:
+    # step by step and pipelined batches through the server answer as the SUL in this process
+    sul_class, alphabet = SYSTEMS[name]
+    words = random_words(random.Random(seed), alphabet, runs, 12)
+    local = sul_class()
+    expected = [local.query(word) for word in words]
+
+    client = SULClient(path=path)
+    remote = RemoteSUL(name, client)
+    for word, outputs in zip(words, expected):
+        assert remote.query(word) == outputs, word
+    for word, outputs in zip(words, expected):
+        if not word:
+            continue
+        remote.pre()
+        assert [remote.step(letter) for letter in word] == outputs, word
+        remote.post()
+    assert remote.query_batch(words, batch_size=64) == expected
+    remote.close()
+    client.close()
+
+
+def check_frame_limit(path: str, server: SULServer) -> None:
+    # an oversize frame is refused without reading it, the connection and its sessions are closed
+    client = SULClient(path=path)
+    client.request({"op": "open", "system": "reservoir"})
+    sessions = len(server.sessions)
+    client.socket.sendall(HEADER.pack(server.max_frame_size + 1))
+    try:
+        client.receive()
+        raise AssertionError("the oversize frame was accepted")
+    except RuntimeError as e:
+        assert "exceeds the maximum" in str(e), e
+    try:
+        client.receive()
+        raise AssertionError("the connection stayed open")
+    except ConnectionError:
+        pass
+    client.close()
+    deadline = time.monotonic() + 5
+    while len(server.sessions) >= sessions and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(server.sessions) == sessions - 1
+
+    # a frame just below the limit is still served
+    client = SULClient(path=path)
+    session = client.request({"op": "open", "system": "reservoir"})["session"]
+    client.request({"op": "close", "session": session, "padding": "x" * (server.max_frame_size - 100)})
+    client.close()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory).joinpath("sul.sock"))
+        server = start_server(path, max_frame_size=1 << 16)
+        for seed, name in enumerate(SYSTEMS):
+            compare_remote(path, name, runs=200, seed=seed)
+            print(f"{name}: the server answers as the local SUL")
+        check_frame_limit(path, server)
+        print("oversize frames are refused and close the connection")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import hashlib
+import mmap
+import struct
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from system_emulations.pump_transfer_system.pumps_controller import PumpsController, \
+    pumps_system_command_handler, PUMPS_OPCODES, PUMPS_MESSAGES
+from system_emulations.reservoir_filling_system.reservoir_controller import ReservoirSystem, \
+    reservoir_system_command_handler, RESERVOIR_OPCODES, RESERVOIR_MESSAGES
+from system_emulations.split_system.split_system_controller import SplitSystemController, \
+    split_system_command_handler, SPLIT_SYSTEM_OPCODES, SPLIT_SYSTEM_MESSAGES
+
+MAGIC = b"SETR"
+VERSION = 2
+FILE_HEADER = struct.Struct("<4sHH")
+# session, timestamp, system, opcode, pump id, value, value kind, result code, state hash
+RECORD = struct.Struct("<IdBhiqBhQ")
+
+VALUE_NONE, VALUE_INT, VALUE_BOOL, VALUE_ASYNC, VALUE_SYNC, VALUE_STR, VALUE_BIG_INT, VALUE_FLOAT = range(8)
+# floats are kept as the bits of the double
+FLOAT_BITS = struct.Struct("<d")
+INT_BITS = struct.Struct("<q")
+INT64_RANGE = range(-2 ** 63, 2 ** 63)
+UINT32_RANGE = range(2 ** 32)
+INVALID_PUMP_ID = -1
+NO_STATE_HASH = 0
+UNKNOWN_OPCODE = -1
+TICK_OPCODE = -2
+
+
+class TraceSystem(NamedTuple):
+    system_class: type
+    handler: object
+    opcodes: dict
+    commands: dict
+    result_codes: dict
+    with_pump_id: bool
+    # commands that take integers of any size, their values outside int64 cannot be logged
+    unbounded_commands: tuple = ()
+
+
+def _trace_system(system_class, handler, opcodes: dict, messages: tuple, with_pump_id: bool,
+                  unbounded_commands: tuple = ()) -> TraceSystem:
+    return TraceSystem(system_class, handler, opcodes,
+                       {opcode: cmd for cmd, opcode in opcodes.items()},
+                       {message: code for code, message in enumerate(messages)}, with_pump_id, unbounded_commands)
+
+
+SYSTEMS = (
+    _trace_system(ReservoirSystem, reservoir_system_command_handler, RESERVOIR_OPCODES,
+                  RESERVOIR_MESSAGES, False),
+    _trace_system(PumpsController, pumps_system_command_handler, PUMPS_OPCODES,
+                  PUMPS_MESSAGES, True),
+    _trace_system(SplitSystemController, split_system_command_handler, SPLIT_SYSTEM_OPCODES,
+                  SPLIT_SYSTEM_MESSAGES, False, ('ST',)),
+)
+SYSTEM_IDS = {"reservoir": 0, "pumps": 1, "hvac": 2}
+
+
+class TraceRecord(NamedTuple):
+    session: int
+    timestamp: float
+    system: int
+    opcode: int
+    pump_id: int
+    value: int
+    value_kind: int
+    result: int
+    state_hash: int
+
+
+def _canonical(value):
+    # equal states give equal reprs: no bool against int, no numpy against Python scalars
+    if isinstance(value, (tuple, list)):
+        return tuple(_canonical(item) for item in value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def state_hash(system) -> int:
+    digest = hashlib.blake2b(repr(_canonical(system.snapshot())).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def encode_value(value) -> tuple:
+    if value is None:
+        return 0, VALUE_NONE
+    if isinstance(value, bool):
+        return int(value), VALUE_BOOL
+    if isinstance(value, int):
+        if value in INT64_RANGE:
+            return value, VALUE_INT
+        # only its sign is kept, the commands that do not reject it are not logged, see TraceSystem
+        return 1 if value > 0 else -1, VALUE_BIG_INT
+    if isinstance(value, float):
+        return INT_BITS.unpack(FLOAT_BITS.pack(value))[0], VALUE_FLOAT
+    if value == "async":
+        return 0, VALUE_ASYNC
+    if value == "sync":
+        return 0, VALUE_SYNC
+    # other strings and values only ever produce type errors, their text is not kept
+    return 0, VALUE_STR
+
+
+def encode_pump_id(pump_id) -> int:
+    # integral floats pass the handlers' range check as well, ids beyond int32 are out of range of every controller
+    if isinstance(pump_id, (int, float)) and -2 ** 31 <= pump_id < 2 ** 31 and pump_id == int(pump_id):
+        return int(pump_id)
+    return INVALID_PUMP_ID
+
+
+def decode_value(value: int, kind: int):
+    if kind == VALUE_NONE:
+        return None
+    if kind == VALUE_INT:
+        return value
+    if kind == VALUE_BOOL:
+        return bool(value)
+    if kind == VALUE_ASYNC:
+        return "async"
+    if kind == VALUE_SYNC:
+        return "sync"
+    if kind == VALUE_BIG_INT:
+        return value * 2 ** 64
+    if kind == VALUE_FLOAT:
+        return FLOAT_BITS.unpack(INT_BITS.pack(value))[0]
+    return "?"
+
+
+class TraceRecorder:
+    def __init__(self, path, buffer_records: int = 4096, hash_state: bool = True):
+        self.path = path
+        self.buffer_records = buffer_records
+        self.hash_state = hash_state
+        self._buffer = bytearray()
+        self._buffered = 0
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION, RECORD.size))
+
+    def record(self, session: int, system_name: str, system, command: tuple, result) -> None:
+        self._pack(self._encode_command(session, system_name, command), system, result)
+
+    def _encode_command(self, session: int, system_name: str, command: tuple) -> tuple:
+        # the record fields before the result and state hash, all checked to fit RECORD
+        if not isinstance(session, int) or session not in UINT32_RANGE:
+            raise ValueError(f"session must be in the range from 0 to {2 ** 32 - 1}")
+        system_id = SYSTEM_IDS[system_name]
+        trace_system = SYSTEMS[system_id]
+        if trace_system.with_pump_id:
+            pump_id, cmd, value = command
+        else:
+            pump_id = 0
+            cmd, value = command[0], command[1] if len(command) > 1 else None
+        value, value_kind = encode_value(value)
+        if value_kind == VALUE_BIG_INT and cmd in trace_system.unbounded_commands:
+            raise ValueError(f"{cmd} values outside int64 cannot be logged")
+        return (session, system_id, trace_system.opcodes.get(cmd, UNKNOWN_OPCODE), encode_pump_id(pump_id),
+                value, value_kind)
+
+    def _pack(self, fields: tuple, system, result) -> None:
+        session, system_id, opcode, pump_id, value, value_kind = fields
+        self._buffer += RECORD.pack(
+            session, time.time(), system_id, opcode, pump_id, value, value_kind,
+            SYSTEMS[system_id].result_codes.get(result, -1),
+            state_hash(system) if self.hash_state else NO_STATE_HASH)
+        self._buffered += 1
+        if self._buffered >= self.buffer_records:
+            self.flush()
+
+    def record_tick(self, session: int, system_name: str, system) -> None:
+        self._buffer += RECORD.pack(
+            session, time.time(), SYSTEM_IDS[system_name], TICK_OPCODE, 0, 0, VALUE_NONE, 0,
+            state_hash(system) if self.hash_state else NO_STATE_HASH)
+        self._buffered += 1
+        if self._buffered >= self.buffer_records:
+            self.flush()
+
+    def wrap(self, system_name: str, session: int = 0):
+        handler = SYSTEMS[SYSTEM_IDS[system_name]].handler
+
+        def recorded_handler(system, *command):
+            # encoded before the handler runs, a command that cannot be logged leaves the system untouched
+            fields = self._encode_command(session, system_name, command)
+            result = handler(system, *command)
+            self._pack(fields, system, result)
+            return result
+        return recorded_handler
+
+    def flush(self) -> None:
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._buffer.clear()
+        self._buffered = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_trace(path):
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version, record_size = FILE_HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                raise ValueError(f"{path} is not a trace file of version {VERSION}")
+            end = len(data) - (len(data) - FILE_HEADER.size) % RECORD.size
+            for fields in RECORD.iter_unpack(memoryview(data)[FILE_HEADER.size:end]):
+                yield TraceRecord(*fields)
+
+
+def decode_command(record: TraceRecord) -> tuple:
+    trace_system = SYSTEMS[record.system]
+    cmd = trace_system.commands.get(record.opcode)
+    value = decode_value(record.value, record.value_kind)
+    if trace_system.with_pump_id:
+        return record.pump_id, cmd, value
+    if record.value_kind == VALUE_NONE:
+        return (cmd,)
+    return cmd, value
+
+
+def replay_trace(path, systems: dict | None = None):
+    # systems: (session, system id) -> controller, new controllers are created on demand
+    systems = systems if systems is not None else {}
+    for index, record in enumerate(read_trace(path)):
+        trace_system = SYSTEMS[record.system]
+        system = systems.get((record.session, record.system))
+        if system is None:
+            system = systems[(record.session, record.system)] = trace_system.system_class()
+        if record.opcode == TICK_OPCODE:
+            system.update()
+            result, result_code = None, 0
+        else:
+            result = trace_system.handler(system, *decode_command(record))
+            result_code = trace_system.result_codes.get(result, -1)
+        replayed_hash = state_hash(system) if record.state_hash != NO_STATE_HASH else NO_STATE_HASH
+        if result_code != record.result or replayed_hash != record.state_hash:
+            yield index, record, result